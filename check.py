@@ -0,0 +1,290 @@
+"""
+Brute force checks of the solvers on small random puzzles
+Each solver is compared with trying every assignment or every move
+Run with `python check.py [rounds] [seed]`
+"""
+import contextlib
+import io
+import itertools
+import random
+import sys
+from puzzle import *
+from sat import SatSolver
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+W, B, E = Colour.WHITE, Colour.BLACK, Colour.EMPTY
+
+def check_sat(rng: random.Random) -> None:
+    """
+    Checks `SatSolver` against every assignment of a tiny random CNF,
+    with clauses added between calls to `solve`
+    """
+    n = rng.randint(1, 7)
+    solver = SatSolver()
+    for _ in range(n):
+        solver.new_var()
+    clauses = []
+    for _ in range(rng.randint(1, 3)):
+        for _ in range(rng.randint(1, 4 * n)):
+            size = rng.randint(1, min(3, n))
+            clause = [v if rng.random() < 0.5 else -v for v in rng.sample(range(1, n + 1), size)]
+            clauses.append(clause)
+            solver.add_clause(clause)
+        want = any(all(any(values[abs(l) - 1] == (l > 0) for l in c) for c in clauses) \
+                   for values in itertools.product((False, True), repeat=n))
+        found = solver.solve()
+        assert found == want, (clauses, found)
+        if found:
+            assert all(any(solver.value(abs(l)) == (l > 0) for l in c) for c in clauses), clauses
+
+def random_logic_grid(rng: random.Random):
+    """
+    Makes a small random LogicGrid puzzle
+    Returns (colours, info, rules, linked cells)
+    """
+    h, w = rng.randint(1, 3), rng.randint(2, 4)
+    cols = [[rng.choice((W, B)) if rng.random() < 0.2 else \
+             (Colour.NA if rng.random() < 0.05 else E) for _ in range(w)] for _ in range(h)]
+    cells = [(i, j) for i in range(h) for j in range(w) if cols[i][j] != Colour.NA]
+    info = {}
+    rules = []
+    for kind in rng.sample(range(8), rng.randint(1, 3)):
+        if kind < 2:
+            ph, pw = rng.choice([(1, 2), (1, 3), (2, 2)])
+            pattern = [[LGC(rng.choice((W, B, E))) for _ in range(pw)] for _ in range(ph)]
+            pattern[0][0] = LGC(rng.choice((W, B)))
+            rule_type = RuleEnum.MATCH_PATTERN if kind == 0 else RuleEnum.MATCH_NOT_PATTERN
+            if rng.random() < 0.5:
+                rules.append(Rule(rule_type, pattern=pattern))
+            else:
+                # Only some of the turns, so rotated grids are different puzzles
+                rules.append(Rule(rule_type, pattern=None, patterns=[pattern]))
+        elif kind == 2:
+            rules.append(Rule(RuleEnum.CONNECT_CELLS, colour=rng.choice((W, B))))
+        elif kind in (3, 4):
+            for c in rng.sample(cells, min(len(cells), rng.randint(1, 2))):
+                info[c] = {"number": rng.randint(1, 4)}
+            rules.append(Rule(RuleEnum.AREA_NUMBER if kind == 3 else RuleEnum.AREA_NUMBERS_ARE_ONE_OFF))
+        elif kind == 5:
+            rules.append(Rule(RuleEnum.N_CELLS_PER_REGION, number=rng.randint(1, 3), \
+                              colour=rng.choice((W, B))))
+        elif kind == 6:
+            for c in rng.sample(cells, min(len(cells), rng.randint(1, 3))):
+                info[c] = {"symbol": 1}
+            rules.append(Rule(RuleEnum.N_SYMBOL_PER_COLOUR, number=rng.randint(1, 2), \
+                              colour=rng.choice((W, B))))
+        else:
+            for c in rng.sample(cells, min(len(cells), rng.randint(2, 3))):
+                info[c] = {"letter": rng.choice("AB")}
+            rules.append(Rule(RuleEnum.LETTER_SORTED))
+    linked = []
+    empty = [(i, j) for i, j in cells if cols[i][j] == E]
+    if len(empty) >= 2 and rng.random() < 0.3:
+        linked = [rng.sample(empty, 2)]
+    return cols, info, rules, linked
+
+def make_logic_grid(cols, info, rules, linked, **kwargs) -> LogicGrid:
+    """
+    Makes a LogicGrid from the parts given by `random_logic_grid`
+    """
+    grid = [[LGC(c, info.get((i, j))) for j, c in enumerate(row)] for i, row in enumerate(cols)]
+    return LogicGrid(grid, list(rules), [list(group) for group in linked], **kwargs)
+
+def is_solution(cols, info, rules, linked) -> bool:
+    """
+    Checks a fully coloured grid against the rules and linked cells
+    """
+    if any(len({cols[i][j].value for i, j in group}) > 1 for group in linked):
+        return False
+    return bool(make_logic_grid(cols, info, rules, [])._test_rules())
+
+def brute_logic_grid(cols, info, rules, linked) -> list:
+    """
+    Gets every solution by trying each colouring of the EMPTY cells
+    """
+    empty = [(i, j) for i, row in enumerate(cols) for j, c in enumerate(row) if c == E]
+    found = []
+    for combo in itertools.product((W, B), repeat=len(empty)):
+        filled = [row[:] for row in cols]
+        for (i, j), c in zip(empty, combo):
+            filled[i][j] = c
+        if is_solution(filled, info, rules, linked):
+            found.append(filled)
+    return found
+
+def solved(lg: LogicGrid, **kwargs) -> bool:
+    """
+    Runs `lg.solution` quietly, returning if it found a solution
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        lg.solution(**kwargs)
+    return "Valid" in out.getvalue()
+
+def turn(cols, info, linked, k: int):
+    """
+    Turns a puzzle the way `Rule.symmetries` turns a 2d array at index `k`
+    """
+    coords = Rule.symmetries([[(i, j) for j in range(len(cols[0]))] for i in range(len(cols))])[k]
+    where = {c: (a, b) for a, row in enumerate(coords) for b, c in enumerate(row)}
+    return [[cols[i][j] for i, j in row] for row in coords], \
+           {where[c]: v for c, v in info.items()}, \
+           [[where[tuple(c)] for c in group] for group in linked]
+
+def check_logic_grid(rng: random.Random, cache: SolutionCache) -> None:
+    """
+    Checks the search, the parallel search, the SAT engine, the bitboard
+    backend, solution counting and the solution cache against every
+    colouring of a small random puzzle
+    """
+    cols, info, rules, linked = random_logic_grid(rng)
+    want = brute_logic_grid(cols, info, rules, linked)
+    for kwargs in ({}, {"backend": "bitboard"}, {"cell_order": ["mrv", "bottleneck"]}):
+        found = sorted(make_logic_grid(cols, info, rules, linked, **kwargs).solutions())
+        assert found == sorted(want), (cols, info, rules, linked, kwargs)
+    lg = make_logic_grid(cols, info, rules, linked)
+    assert lg.count_solutions() == len(want)
+    assert lg.count_solutions(1) == min(1, len(want))
+    assert lg.count_solutions(0) == 0
+    engines = [{"engine": "search"}, {"engine": "sat"}]
+    # Starting processes is slow, so only some rounds search in parallel
+    if rng.random() < 0.1:
+        engines.append({"workers": 2})
+    for kwargs in engines:
+        lg = make_logic_grid(cols, info, rules, linked)
+        assert solved(lg, **kwargs) == bool(want), (cols, info, rules, linked, kwargs)
+        if want:
+            assert [[c.col for c in row] for row in lg.g] in want
+    # A turned grid keeps its rules' patterns, so it may not be the same puzzle
+    for k in (0, rng.randrange(1, 8)):
+        cols, info, linked = turn(cols, info, linked, k)
+        want = brute_logic_grid(cols, info, rules, linked)
+        lg = make_logic_grid(cols, info, rules, linked, cache=cache)
+        assert solved(lg) == bool(want), (cols, info, rules, linked, k)
+        if want:
+            assert [[c.col for c in row] for row in lg.g] in want
+
+def replay(grid, moves) -> bool:
+    """
+    Plays `moves` (last move first) on a new board, checking each is allowed
+    Returns if the board ends up cleared
+    """
+    m = Match3([row[:] for row in grid])
+    for move in reversed(moves):
+        if move not in m.generate_moves():
+            return False
+        m.swap(*move)
+    return m.is_solved()
+
+def brute_match3(m: Match3, depth: int = 0):
+    """
+    Tries every sequence of moves without pruning
+    Returns (number of solutions, fewest moves in one or None)
+    """
+    if m.is_solved():
+        return 1, depth
+    count, fewest = 0, None
+    mark = len(m._trail)
+    for move in m.generate_moves():
+        m.swap(*move)
+        n, d = brute_match3(m, depth + 1)
+        count += n
+        if d is not None and (fewest is None or d < fewest):
+            fewest = d
+        m._undo(mark)
+    return count, fewest
+
+def check_match3(rng: random.Random, cache: SolutionCache) -> None:
+    """
+    Checks solving, the shortest solution, counting, enumeration, the move
+    orders, the numpy backend, the parallel search and the solution cache
+    against every sequence of moves on a small random board
+    """
+    h, w = rng.randint(3, 4), rng.randint(3, 4)
+    types = ["a", "b", "c"][:rng.randint(2, 3)]
+    grid = [[rng.choice(types) if rng.random() < 0.7 else \
+             rng.choice((0, 0, "#")) for _ in range(w)] for _ in range(h)]
+    m = Match3([row[:] for row in grid])
+    if m.is_solved():
+        return
+    count, fewest = brute_match3(Match3([row[:] for row in grid], dead_state_checks=[]))
+    moves = m.solve()
+    assert (moves is None) == (count == 0), grid
+    if moves is not None:
+        assert replay(grid, moves), (grid, moves)
+    shortest = Match3([row[:] for row in grid]).solve(shortest=True)
+    assert (shortest is None) == (fewest is None), grid
+    if shortest is not None:
+        assert len(shortest) == fewest and replay(grid, shortest), (grid, shortest)
+    m = Match3([row[:] for row in grid])
+    assert m.count_solutions(0) == 0, grid
+    assert m.count_solutions() == count, grid
+    assert m.count_solutions(1) == min(1, count), grid
+    # Stopping at a limit must not leave the board marked unsolvable
+    m = Match3([row[:] for row in grid])
+    assert m.count_solutions(0) == 0 and m.count_solutions(1) == min(1, count), grid
+    assert m.count_solutions() == count and (m.solve() is None) == (count == 0), grid
+    found = list(Match3([row[:] for row in grid]).solutions())
+    assert len(found) == count and all(replay(grid, s) for s in found), grid
+    # Starting processes is slow, so only some rounds search in parallel
+    if rng.random() < 0.1:
+        for shortest in (False, True):
+            m = Match3([row[:] for row in grid])
+            moves = m.solve(shortest, workers=2)
+            assert (moves is None) == (count == 0), (grid, shortest)
+            assert m.is_solved() == (moves is not None), (grid, shortest)
+            if moves is not None:
+                assert replay(grid, moves), (grid, shortest, moves)
+                assert not shortest or len(moves) == fewest, (grid, moves)
+    # Move orders may change which solution is found, but not whether there is one
+    order = rng.sample(Match3.MOVE_ORDERS, rng.randint(1, len(Match3.MOVE_ORDERS)))
+    moves = Match3([row[:] for row in grid], move_order=order).solve()
+    assert (moves is None) == (count == 0), (grid, order)
+    if moves is not None:
+        assert replay(grid, moves), (grid, order, moves)
+    shortest = Match3([row[:] for row in grid], move_order=order).solve(shortest=True)
+    assert (shortest is None) == (fewest is None), (grid, order)
+    if shortest is not None:
+        assert len(shortest) == fewest and replay(grid, shortest), (grid, order, shortest)
+    assert Match3([row[:] for row in grid], move_order=order).count_solutions() == count, (grid, order)
+    if numpy is not None:
+        m = Match3([row[:] for row in grid], backend="numpy")
+        assert sorted(m.generate_moves()) == sorted(Match3([row[:] for row in grid]).generate_moves())
+        shortest = m.solve(shortest=True)
+        assert (shortest is None) == (fewest is None), grid
+        if shortest is not None:
+            assert len(shortest) == fewest and replay(grid, shortest), (grid, shortest)
+        assert Match3([row[:] for row in grid], backend="numpy").count_solutions() == count, grid
+    # Setting a new board must forget everything learnt on the old one
+    m = Match3([[t for t in row[::-1]] for row in grid])
+    m.solve()
+    m.g = [row[:] for row in grid]
+    assert m.count_solutions() == count, grid
+    for board in (grid, [row[::-1] for row in grid]):
+        for _ in range(2):
+            m = Match3([row[:] for row in board], cache=cache)
+            moves = m.solve(shortest=True)
+            assert (moves is None) == (fewest is None), board
+            # A cache hit leaves the board cleared, as a search does
+            assert m.is_solved() == (moves is not None), board
+            if moves is not None:
+                assert len(moves) == fewest and replay(board, moves), (board, moves)
+
+def main(rounds: int = 200, seed: int = 0) -> None:
+    """
+    Runs every check `rounds` times
+    """
+    rng = random.Random(seed)
+    cache = SolutionCache(":memory:")
+    for name, check in (("sat", lambda: check_sat(rng)), \
+                        ("logic grid", lambda: check_logic_grid(rng, cache)), \
+                        ("match3", lambda: check_match3(rng, cache))):
+        for _ in range(rounds):
+            check()
+        print(f"{name}: {rounds} ok")
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
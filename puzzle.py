@@ -1,11 +1,159 @@
 """
 Islands of Insight puzzle solvers
 """
-from datetime import datetime as dt
-import copy
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from enum import Enum
+import hashlib
 from itertools import groupby
+import json
+from math import inf
+import multiprocessing
+import queue
+import random
 from re import findall
+import sqlite3
+
+from sat import SatSolver
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class SearchCancelled(Exception):
+    """
+    Raised inside a search that has been told to stop early
+    """
+
+class TranspositionTable():
+    """
+    Bounded cache of search results keyed by a board hash
+    param `max_entries` caps how many boards are remembered
+        once full, the least recently used entry is evicted
+    """
+    def __init__(self, max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.table = OrderedDict()
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def get(self, key, default = None):
+        """
+        Gets the value stored for `key`, marking it as recently used
+        """
+        if key not in self.table:
+            return default
+        self.table.move_to_end(key)
+        return self.table[key]
+
+    def store(self, key, value) -> None:
+        """
+        Stores `value` for `key`, evicting the oldest entry if over capacity
+        """
+        self.table[key] = value
+        self.table.move_to_end(key)
+        if len(self.table) > self.max_entries:
+            self.table.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes every entry
+        """
+        self.table.clear()
+
+class SolutionCache():
+    """
+    Solutions kept on disk between runs, in an sqlite database
+    Keys are puzzle fingerprints, values anything json can store
+    param `path` the database file, ":memory:" keeps the cache for this run only
+    param `max_entries` caps how many solutions are kept
+        once full, the least recently used tenth is evicted
+    Lookups are only written back (as recent uses) with the next `store` or `flush`
+    """
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        # A lost update only costs a solve, so commits don't wait for the disk
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS solutions " \
+                        "(key TEXT PRIMARY KEY, value TEXT, used INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)")
+        self.db.commit()
+        self._count, clock = self.db.execute("SELECT COUNT(*), MAX(used) FROM solutions").fetchone()
+        self._clock = clock or 0
+        self._touched = {}
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self.db.execute("SELECT 1 FROM solutions WHERE key = ?", (key,)).fetchone() is not None
+
+    def _stamp(self) -> int:
+        """
+        Gets a use stamp later than every one given out so far
+        """
+        self._clock += 1
+        return self._clock
+
+    def get(self, key, default = None):
+        """
+        Gets the value stored for `key`, marking it as recently used
+        """
+        row = self.db.execute("SELECT value FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        self._touched[key] = self._stamp()
+        return json.loads(row[0])
+
+    def store(self, key, value) -> None:
+        """
+        Stores `value` for `key`, evicting the oldest entries if over capacity
+        """
+        self._touched.pop(key, None)
+        self._write_touched()
+        new = key not in self
+        self.db.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)", \
+                        (key, json.dumps(value), self._stamp()))
+        self._count += new
+        if self._count > self.max_entries:
+            # Evicting a batch at once keeps this off most stores
+            excess = self._count - self.max_entries * 9 // 10
+            self._count -= self.db.execute("DELETE FROM solutions WHERE key IN " \
+                                           "(SELECT key FROM solutions ORDER BY used LIMIT ?)", \
+                                           (excess,)).rowcount
+        self.db.commit()
+
+    def _write_touched(self) -> None:
+        """
+        Writes the use stamps of the entries looked up since the last write
+        """
+        if self._touched:
+            self.db.executemany("UPDATE solutions SET used = ? WHERE key = ?", \
+                                [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def flush(self) -> None:
+        """
+        Saves which entries were looked up recently
+        """
+        self._write_touched()
+        self.db.commit()
+
+    def clear(self) -> None:
+        """
+        Removes every entry
+        """
+        self._touched.clear()
+        self.db.execute("DELETE FROM solutions")
+        self.db.commit()
+        self._count = 0
 
 class Match3():
     """
@@ -14,86 +162,311 @@ class Match3():
     0 is empty space
     param `grid` is a 2d array representing the objects
         each unique element can be combined
+    param `tt_size` is the maximum number of boards kept in the transposition table
+    param `cache` default None
+        a `SolutionCache` solutions are looked up in and stored to, boards
+        that are mirror images or only differ in tile types share an entry
     func `solution` prints a solution to the Match3 puzzle to console
+
+    `g` is read only tile by tile, it gives the grid as tuples of tiles
+    decoded from `cells`, assigning a whole grid to it loads a new board
+    The board is stored flat in `cells`, one byte per cell, row by row
+    Each byte is a code into `tiles`:
+        0 is empty space, 1 and 2 are the rocks '#' and -1,
+        3 and above are the tile types in the order they were first seen
+    Every write is logged to a trail so moves can be undone without copying
+
+    The transposition table maps a board hash to a lower bound on the
+    number of moves needed to clear it, `UNSOLVABLE` if it can never be,
+    and ("count", hash) to the number of solutions from that board
+
+    Rocks split the board into regions that tiles can never leave
+    param `dead_state_checks` default `DEAD_STATE_CHECKS`
+        functions taking the Match3 and returning True if the board can
+        never be cleared, run at every node before generating moves
+    param `backend` default "python"
+        "numpy" tests every swap at once with numpy when generating moves
+    param `move_order` default None
+        the heuristics (one or a list of `MOVE_ORDERS`) used to sort moves
+        best first during the search, None keeps row major order
+        "clear" prefers moves that clear the most tiles
+        "rarest" prefers moves that clear the most of the rarest tile type
+        "cascade" prefers moves that cause the most cascades
+        "history" prefers moves that led to solutions (and away from dead
+        boards) earlier in the search
     """
-    def __init__(self, grid: list[list[str]]):
-        self.g = grid
-        self.width = len(grid[0])
-        self.height = len(grid)
-        while True:
-            if not self._check3():
-                break
+    ZOBRIST_SEED = 0x1515
+    EMPTY = 0
+    ROCKS = ('#', -1)
+    ROCK_CODES = (1, 2)
+    FIRST_TILE = 3
+    UNSOLVABLE = inf
+    MOVE_ORDERS = ("clear", "rarest", "cascade", "history")
+
+    def __init__(self, grid: list[list[str]], tt_size: int = 1_000_000, \
+                 dead_state_checks = None, backend: str = "python", move_order = None, \
+                 cache: SolutionCache = None):
+        if backend not in ("python", "numpy"):
+            raise ValueError(f"Unknown backend {backend}")
+        if isinstance(move_order, str):
+            move_order = [move_order]
+        for order in move_order or []:
+            if order not in self.MOVE_ORDERS:
+                raise ValueError(f"Unknown move order {order}")
+        if backend == "numpy" and np is None:
+            raise ImportError("The numpy backend needs numpy to be installed")
+        self.backend = backend
+        self.move_order = list(move_order or [])
+        self.tt = TranspositionTable(tt_size)
+        self.cache = cache
+        if dead_state_checks is None:
+            dead_state_checks = self.DEAD_STATE_CHECKS
+        self.dead_state_checks = list(dead_state_checks)
+        self._nodes = 0
+        self._cancelled = None
+        self._start(grid)
 
     def __str__(self):
-        return str(self.g)
+        return str([list(row) for row in self.g])
 
     def __repr__(self):
         out = ""
-        for j in range(self.height):
-            out += " ".join(str(x) for x in self.g[j]) + "\n"
+        for row in self.g:
+            out += " ".join(str(x) for x in row) + "\n"
         return out[:-1]
 
+    @property
+    def g(self) -> tuple[tuple[str]]:
+        """
+        The grid as rows of the original tile values
+        The rows are tuples, so writing to a tile raises a TypeError instead
+        of being lost, set `g` to a whole new grid to change the board
+        """
+        return tuple(tuple(self.tiles[c] for c in self.cells[i * self.width:(i + 1) * self.width]) \
+                     for i in range(self.height))
+
+    @g.setter
+    def g(self, grid: list[list[str]]):
+        self._start(grid)
+
+    def _start(self, grid: list[list[str]]):
+        """
+        Loads a new grid and lets it settle, forgetting what was learnt
+        about the last one (its boards' hashes may now mean other boards)
+        """
+        self.tt.clear()
+        self.history = {} if "history" in self.move_order else None
+        self._load(grid)
+        self._drop()
+        while True:
+            if not self._check3():
+                break
+        # Cascades of the starting grid can not be undone
+        self._trail.clear()
+
+    def _load(self, grid: list[list[str]]):
+        """
+        Encodes a 2d array into `cells`
+        """
+        self.width = len(grid[0])
+        self.height = len(grid)
+        self.tiles = [0, *self.ROCKS]
+        codes = {tile: code for code, tile in enumerate(self.tiles)}
+        self.cells = bytearray(self.width * self.height)
+        for i, row in enumerate(grid):
+            for j, cell in enumerate(row):
+                if cell not in codes:
+                    if len(self.tiles) == 256:
+                        raise ValueError("Too many tile types")
+                    codes[cell] = len(self.tiles)
+                    self.tiles.append(cell)
+                self.cells[i * self.width + j] = codes[cell]
+        self.counts = [0] * len(self.tiles)
+        for code in self.cells:
+            self.counts[code] += 1
+        self._find_regions()
+        self._trail = []
+        self._dirty = set(range(len(self.cells)))
+        self._init_zobrist()
+
+    def _find_regions(self):
+        """
+        Labels the areas of the board that are split up by rocks
+        `region` holds the region of each cell, -1 for rocks
+        `region_has_line` says if a region has 3 cells in a straight line,
+        without which no tile in it can ever be cleared
+        `region_counts` holds how many of each tile type are in each region
+        """
+        w = self.width
+        c = self.cells
+        rocks = self.ROCK_CODES
+        self.region = [-1] * len(c)
+        self.region_has_line = []
+        for start in range(len(c)):
+            if c[start] in rocks or self.region[start] >= 0:
+                continue
+            r = len(self.region_has_line)
+            has_line = False
+            self.region[start] = r
+            stack = [start]
+            while stack:
+                idx = stack.pop()
+                j = idx % w
+                if j < w - 2 and c[idx+1] not in rocks and c[idx+2] not in rocks:
+                    has_line = True
+                if idx + 2*w < len(c) and c[idx+w] not in rocks \
+                        and c[idx+2*w] not in rocks:
+                    has_line = True
+                for n in (idx - w, idx + w, idx - 1 if j > 0 else -1, \
+                          idx + 1 if j < w - 1 else -1):
+                    if 0 <= n < len(c) and c[n] not in rocks and self.region[n] < 0:
+                        self.region[n] = r
+                        stack.append(n)
+            self.region_has_line.append(has_line)
+        self.region_counts = [0] * (len(self.region_has_line) * len(self.tiles))
+        for idx, code in enumerate(c):
+            if self.region[idx] >= 0:
+                self.region_counts[self.region[idx] * len(self.tiles) + code] += 1
+
+    def _init_zobrist(self):
+        """
+        Creates a random 64 bit key for every (tile type, cell) pair
+        and computes the hash of the current grid from them
+        Empty space and rocks never change the hash
+        """
+        rng = random.Random(self.ZOBRIST_SEED)
+        size = len(self.cells)
+        self._zobrist = [0] * (self.FIRST_TILE * size)
+        self._zobrist += [rng.getrandbits(64) \
+            for _ in range((len(self.tiles) - self.FIRST_TILE) * size)]
+        self.hash = 0
+        for idx, code in enumerate(self.cells):
+            self.hash ^= self._zobrist[code * size + idx]
+
+    def _set(self, idx: int, code: int):
+        """
+        Sets the cell at flat index `idx` to `code`
+        The old code is pushed onto the trail, the hash and tile counts are
+        kept up to date and the cell is marked dirty for the next `_check3`
+        """
+        size = len(self.cells)
+        old = self.cells[idx]
+        self.hash ^= self._zobrist[old * size + idx] ^ self._zobrist[code * size + idx]
+        self.counts[old] -= 1
+        self.counts[code] += 1
+        # Rocks are in no region, a rock only gets here by `swap` moving it
+        if self.region[idx] >= 0:
+            base = self.region[idx] * len(self.tiles)
+            self.region_counts[base + old] -= 1
+            self.region_counts[base + code] += 1
+        self.cells[idx] = code
+        self._trail.append(idx << 8 | old)
+        self._dirty.add(idx)
+
+    def _undo(self, mark: int):
+        """
+        Rewinds the trail until it is `mark` entries long,
+        restoring every cell written since then and marking it dirty
+        """
+        size = len(self.cells)
+        trail = self._trail
+        while len(trail) > mark:
+            entry = trail.pop()
+            idx = entry >> 8
+            old = entry & 0xFF
+            code = self.cells[idx]
+            self.hash ^= self._zobrist[code * size + idx] ^ self._zobrist[old * size + idx]
+            self.counts[code] -= 1
+            self.counts[old] += 1
+            if self.region[idx] >= 0:
+                base = self.region[idx] * len(self.tiles)
+                self.region_counts[base + code] -= 1
+                self.region_counts[base + old] += 1
+            self.cells[idx] = old
+            self._dirty.add(idx)
+
+    def _runs_through(self, idx: int) -> list[int]:
+        """
+        Returns the cells of any 3 in a row (or longer) that `idx` is part of
+        """
+        c = self.cells
+        w = self.width
+        cell = c[idx]
+        if cell < self.FIRST_TILE:
+            return []
+        out = []
+        # n in a row:
+        left = right = idx
+        while left % w > 0 and c[left-1] == cell:
+            left -= 1
+        while right % w < w - 1 and c[right+1] == cell:
+            right += 1
+        if right - left >= 2:
+            out.extend(range(left, right + 1))
+        # n in a column :
+        up = down = idx
+        while up >= w and c[up-w] == cell:
+            up -= w
+        while down + w < len(c) and c[down+w] == cell:
+            down += w
+        if down - up >= 2 * w:
+            out.extend(range(up, down + 1, w))
+        return out
+
     def _check3(self, do_stuff = True):
         """
         Checks if 3 in a row exists
+        Only the rows and columns through cells written since the last
+        check (`_dirty`) are looked at, any other 3 in a row would already
+        have been removed
         param `do_stuff` default True
             if True, will convert any found 3 in a rows (or longer) to 0s
         """
-        cells_to_remove = []
-        for i in range(self.height):
-            for j in range(self.width):
-                cell = self.g[i][j]
-                if cell in [0,-1,'#']:
-                    continue
-
-                # n in a column :
-                if i < self.height - 2: # Two below
-                    if cell == self.g[i+1][j] and cell == self.g[i+2][j]:
-                        cells_to_remove.append((i,j))
-                        continue
-                if i > 0 and i < self.height - 1: # One below, One above
-                    if cell == self.g[i-1][j] and cell == self.g[i+1][j]:
-                        cells_to_remove.append((i,j))
-                        continue
-                if i > 1: # Two above
-                    if cell == self.g[i-2][j] and cell == self.g[i-1][j]:
-                        cells_to_remove.append((i,j))
-                        continue
-
-                # n in a row:
-                if j < self.width - 2: # Two to the right
-                    if cell == self.g[i][j+1] and cell == self.g[i][j+2]:
-                        cells_to_remove.append((i,j))
-                        continue
-                if j > 0 and j < self.width - 1: # One left, One right
-                    if cell == self.g[i][j-1] and cell == self.g[i][j+1]:
-                        cells_to_remove.append((i,j))
-                        continue
-                if j > 1: # Two to the left
-                    if cell == self.g[i][j-2] and cell == self.g[i][j-1]:
-                        cells_to_remove.append((i,j))
-                        continue
+        cells_to_remove = set()
+        for idx in self._dirty:
+            cells_to_remove.update(self._runs_through(idx))
         if do_stuff:
-            for cell in cells_to_remove:
-                self.g[cell[0]][cell[1]] = 0
-
-            while True:
-                if not self._drop():
-                    break
+            self._dirty = set()
+            columns = set()
+            for idx in cells_to_remove:
+                self._set(idx, self.EMPTY)
+                columns.add(idx % self.width)
+            self._drop(columns)
         return len(cells_to_remove) > 0
 
-    def _drop(self):
+    def _drop(self, columns = None) -> list[int]:
         """
         Drops all tiles to the lowest possible position
+        Each column is compacted in a single pass from the bottom up,
+        rocks split a column into parts that are compacted separately
+        param `columns` default None
+            if given, only these columns are compacted
+        Returns the columns in which a tile moved
         """
-        has_dropped = False
-        for i in range(self.height - 1):
-            for j in range(self.width):
-                if self.g[i][j] not in [0,-1,'#'] and self.g[i+1][j] == 0:
-                    self.g[i+1][j] = self.g[i][j]
-                    self.g[i][j] = 0
-                    has_dropped = True
-        return has_dropped
+        c = self.cells
+        w = self.width
+        if columns is None:
+            columns = range(w)
+        changed = []
+        for j in columns:
+            moved = False
+            bottom = len(c) - w + j
+            target = bottom # Lowest cell not yet filled
+            for idx in range(bottom, -1, -w):
+                cell = c[idx]
+                if cell == self.EMPTY:
+                    continue
+                if cell < self.FIRST_TILE: # Rock, fill from above it
+                    target = idx - w
+                    continue
+                if idx != target:
+                    self._set(target, cell)
+                    self._set(idx, self.EMPTY)
+                    moved = True
+                target -= w
+            if moved:
+                changed.append(j)
+        return changed
 
     def swap(self, x1, y1, x2, y2, do_stuff = True):
         """
@@ -101,14 +474,25 @@ class Match3():
         (x1,y1) <-> (x2,y2)
         param do_stuff default True
             if True, call _check3
+        Returns the number of times tiles were cleared
         """
-        old1 = self.g[x1][y1]
-        self.g[x1][y1] = self.g[x2][y2]
-        self.g[x2][y2] = old1
+        idx1 = x1 * self.width + y1
+        idx2 = x2 * self.width + y2
+        old1 = self.cells[idx1]
+        self._set(idx1, self.cells[idx2])
+        self._set(idx2, old1)
+        if old1 in self.ROCK_CODES or self.cells[idx1] in self.ROCK_CODES:
+            # Moving a rock changes the regions, and what was learnt about
+            # boards (keyed by their tiles only) no longer holds
+            self._find_regions()
+            self.tt.clear()
+        cascades = 0
         if do_stuff:
             while True:
                 if not self._check3():
                     break
+                cascades += 1
+        return cascades
 
     def _check_if_move_valid(self, x1, y1, x2, y2):
         """
@@ -119,27 +503,33 @@ class Match3():
             return False
         if abs(y1-y2) != 1 and x1 == x2:
             return False
-        # Either are 0
-        if self.g[x1][y1] == 0 or self.g[x2][y2] == 0:
+        tile1 = self.cells[x1 * self.width + y1]
+        tile2 = self.cells[x2 * self.width + y2]
+        # Either are empty space or rocks
+        if tile1 < self.FIRST_TILE or tile2 < self.FIRST_TILE:
             return False
         # They are the same
-        if self.g[x1][y1] == self.g[x2][y2]:
+        if tile1 == tile2:
             return False
         # Swapping would not result in anything happening
-        self.swap(x1, y1, x2, y2, False)
-        result = self._check3(False)
-        self.swap(x1, y1, x2, y2, False)
+        # Only the two swapped cells can be part of a new 3 in a row
+        idx1 = x1 * self.width + y1
+        idx2 = x2 * self.width + y2
+        self.cells[idx1], self.cells[idx2] = tile2, tile1
+        result = len(self._runs_through(idx1)) > 0 or len(self._runs_through(idx2)) > 0
+        self.cells[idx1], self.cells[idx2] = tile1, tile2
         return result
 
     def generate_moves(self):
         """
         Generates a list of available moves
         """
+        if self.backend == "numpy":
+            return self._generate_moves_numpy()
         moves = []
         for i in range(self.height):
             for j in range(self.width):
-                cell = self.g[i][j]
-                if cell == 0:
+                if self.cells[i * self.width + j] < self.FIRST_TILE:
                     continue
                 # Check if swaps with tile orthogonally down
                 if i < self.height - 1:
@@ -151,50 +541,547 @@ class Match3():
                         moves.append((i, j, i, j+1))
         return moves
 
+    def _generate_moves_numpy(self):
+        """
+        Generates the same list of moves as `generate_moves`
+        Every swap is tested at once by comparing shifted copies of the board
+        """
+        h, w = self.height, self.width
+        board = np.full((h + 4, w + 4), -1, dtype=np.int16)
+        board[2:-2, 2:-2] = np.frombuffer(self.cells, dtype=np.uint8).reshape(h, w)
+
+        def at(di, dj):
+            """
+            at(di, dj)[i, j] is the cell (i + di, j + dj), -1 off the board
+            """
+            return board[2 + di:2 + di + h, 2 + dj:2 + dj + w]
+
+        def in_column(v):
+            """
+            Where putting v would make 3 in a column
+            """
+            up, down = at(-1, 0) == v, at(1, 0) == v
+            return (up & (at(-2, 0) == v)) | (up & down) | (down & (at(2, 0) == v))
+
+        def in_row(v):
+            """
+            Where putting v would make 3 in a row
+            """
+            left, right = at(0, -1) == v, at(0, 1) == v
+            return (left & (at(0, -2) == v)) | (left & right) | (right & (at(0, 2) == v))
+
+        tile = at(0, 0) >= self.FIRST_TILE
+
+        # Swaps with the tile to the right
+        # The left cell can only match leftwards or in its column, and the
+        # right cell only rightwards or in its column
+        v = at(0, 1)
+        left_ok = ((at(0, -1) == v) & (at(0, -2) == v)) | in_column(v)
+        v = at(0, -1)
+        right_ok = ((at(0, 1) == v) & (at(0, 2) == v)) | in_column(v)
+        right = tile & (at(0, 1) >= self.FIRST_TILE) & (at(0, 0) != at(0, 1))
+        right[:, :-1] &= left_ok[:, :-1] | right_ok[:, 1:]
+
+        # Swaps with the tile below
+        v = at(1, 0)
+        top_ok = ((at(-1, 0) == v) & (at(-2, 0) == v)) | in_row(v)
+        v = at(-1, 0)
+        bottom_ok = ((at(1, 0) == v) & (at(2, 0) == v)) | in_row(v)
+        down = tile & (at(1, 0) >= self.FIRST_TILE) & (at(0, 0) != at(1, 0))
+        down[:-1] &= top_ok[:-1] | bottom_ok[1:]
+
+        # Row major order, with the swap down before the swap right
+        return [(i, j, i + 1, j) if d == 0 else (i, j, i, j + 1) \
+                for i, j, d in np.argwhere(np.stack((down, right), axis=-1)).tolist()]
+
     def is_solved(self):
         """
         Checks if the grid is solved
         A grid is solved iff the cells only contain 0,-1, or '#'
         """
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.g[i][j] not in [0,-1,'#']:
-                    return False
-        return True
+        return not any(self.counts[self.FIRST_TILE:])
+
+    def _order_moves(self, moves: list) -> list:
+        """
+        Sorts `moves` best first by the `move_order` heuristics
+        Each heuristic breaks ties of the ones before it, and moves that
+        tie on all of them stay in row major order
+        """
+        if not self.move_order:
+            return moves
+        scores = []
+        for move in moves:
+            score = []
+            if self.move_order != ["history"]:
+                before = self.counts[self.FIRST_TILE:]
+                rarest = min((c, code) for code, c in enumerate(before) if c > 0)[1]
+                mark = len(self._trail)
+                cascades = self.swap(*move)
+                after = self.counts[self.FIRST_TILE:]
+                self._undo(mark)
+            for order in self.move_order:
+                if order == "clear":
+                    score.append(sum(before) - sum(after))
+                elif order == "rarest":
+                    score.append(before[rarest] - after[rarest])
+                elif order == "cascade":
+                    score.append(cascades)
+                else:
+                    score.append(self.history.get(move, 0))
+            scores.append(score)
+        order = sorted(range(len(moves)), key=lambda k: scores[k], reverse=True)
+        return [moves[k] for k in order]
+
+    def _learn(self, move, solved: bool):
+        """
+        Updates the history table after the subtree of `move` has been searched
+        """
+        if self.history is not None:
+            self.history[move] = self.history.get(move, 0) + (1 if solved else -1)
+
+    def _dead_by_count(self) -> bool:
+        """
+        Every clear removes at least 3 tiles of one type, so a type with
+        only 1 or 2 tiles left can never be cleared
+        """
+        for count in self.counts[self.FIRST_TILE:]:
+            if 0 < count < 3:
+                return True
+        return False
+
+    def _dead_by_region(self) -> bool:
+        """
+        Tiles can not leave the region they are in, so a type with 1 or 2
+        tiles left in a region, or any tile in a region without 3 cells in
+        a straight line, can never be cleared
+        """
+        n = len(self.tiles)
+        for r, has_line in enumerate(self.region_has_line):
+            for count in self.region_counts[r * n + self.FIRST_TILE:(r + 1) * n]:
+                if count and (count < 3 or not has_line):
+                    return True
+        return False
+
+    DEAD_STATE_CHECKS = (_dead_by_count, _dead_by_region)
+
+    def is_dead(self) -> bool:
+        """
+        Checks if any of the dead state checks prove the grid can never be solved
+        """
+        for check in self.dead_state_checks:
+            if check(self):
+                return True
+        return False
+
+    def _lower_bound(self):
+        """
+        Lower bound on the number of moves needed to clear the grid
+        Past the dead state checks the tile counts can not promise more
+        than 1 move, as a single move can clear any number of types
+        through cascades
+        """
+        if self.is_solved():
+            return 0
+        if self.is_dead():
+            return self.UNSOLVABLE
+        return 1
+
+    def solve(self, shortest = False, workers = 1):
+        """
+        Finds a solution, returned as a list of moves with the last move first
+        Returns None if there is no solution
+        param `shortest` default False
+            if True, the solution uses as few moves as possible
+        param `workers` default 1
+            if more than 1, the search is split between that many processes
+        If a solution is found the board is left cleared by it, however it
+        was found, otherwise the board is left as it was
+        """
+        if self.is_solved():
+            return []
+        moves = False
+        if self.cache is not None:
+            key, mirrored = self._fingerprint(shortest)
+            if key in self.cache:
+                moves = self._mirror_moves(self.cache.get(key), mirrored)
+        if moves is False:
+            if workers > 1:
+                moves = self._solve_parallel(shortest, workers)
+            elif shortest:
+                moves = self._solve_shortest()
+            else:
+                moves = self._dfs()
+            if self.cache is not None:
+                self.cache.store(key, self._mirror_moves(moves, mirrored))
+        # The serial searches stop on the cleared board, the other ways
+        # of finding a solution leave the board untouched
+        if moves is not None and not self.is_solved():
+            for move in reversed(moves):
+                self.swap(*move)
+        return moves
+
+    def _fingerprint(self, shortest: bool):
+        """
+        Gets a key for the board and search mode for the solution cache
+        Tiles are renumbered in the order they are first seen and both rocks
+        are the same, and of the board and its mirror image (tiles fall,
+        so it can't be rotated) the one with the smaller encoding is used
+        Returns (key, mirrored), `mirrored` if the mirror image was used
+        """
+        best = None
+        for mirrored in (False, True):
+            renumber = {}
+            grid = []
+            for i in range(self.height):
+                row = self.cells[i * self.width:(i + 1) * self.width]
+                if mirrored:
+                    row = row[::-1]
+                out = []
+                for code in row:
+                    if code >= self.FIRST_TILE:
+                        code = renumber.setdefault(code, self.FIRST_TILE + len(renumber))
+                    elif code in self.ROCK_CODES:
+                        code = self.ROCK_CODES[0]
+                    out.append(code)
+                grid.append(out)
+            text = json.dumps(grid)
+            if best is None or text < best[0]:
+                best = (text, mirrored)
+        text = json.dumps(["Match3", best[0], shortest])
+        return hashlib.sha256(text.encode()).hexdigest(), best[1]
+
+    def _mirror_moves(self, moves: list, mirrored: bool):
+        """
+        Flips `moves` left to right if `mirrored`, keeping the left tile first
+        """
+        if moves is None:
+            return None
+        if not mirrored:
+            return [tuple(move) for move in moves]
+        out = []
+        for x1, y1, x2, y2 in moves:
+            y1, y2 = self.width - 1 - y1, self.width - 1 - y2
+            if (x1, y1) > (x2, y2):
+                x1, y1, x2, y2 = x2, y2, x1, y1
+            out.append((x1, y1, x2, y2))
+        return out
+
+    def _check_cancelled(self):
+        """
+        Counts a search node, every 1024 nodes asks `_cancelled` (if set)
+        whether the search should stop
+        """
+        self._nodes += 1
+        if self._cancelled is not None and self._nodes % 1024 == 0 and self._cancelled():
+            raise SearchCancelled()
 
-    def solve(self, _depth = 0):
+    def _dfs(self, _depth = 0):
         """
         Does a DFS to find a solution
+        Boards proven to be unsolvable are stored in the transposition
+        table so that reaching them again by another move order is free
         """
-        moves = self.generate_moves()
-        stored_grid = copy.deepcopy(self.g)
+        self._check_cancelled()
+        if self.tt.get(self.hash, 0) == self.UNSOLVABLE or self.is_dead():
+            return None
+        moves = self._order_moves(self.generate_moves())
+        mark = len(self._trail)
         for move in moves:
             # Make move
             self.swap(*move)
 
             # If the puzzle is solved, return the move
             if self.is_solved():
+                self._learn(move, True)
                 return [move]
 
             # If a solution is found, return the moves
-            solution = self.solve(_depth + 1)
+            solution = self._dfs(_depth + 1)
             if solution is not None:
+                self._learn(move, True)
                 solution.append(move)
                 return solution
+            self._learn(move, False)
 
             # Undo move
-            self.g = copy.deepcopy(stored_grid)
+            self._undo(mark)
+        self.tt.store(self.hash, self.UNSOLVABLE)
+        return None
+
+    def _solve_shortest(self):
+        """
+        Does an iterative deepening search (IDA*) for the shortest solution
+        Each iteration raises the move limit to the smallest bound proven by
+        the last one, so no iteration is wasted on a limit known to fail
+        """
+        limit = self._lower_bound()
+        if limit == 0:
+            return []
+        while limit < self.UNSOLVABLE:
+            solution, limit = self._search_limited(limit)
+            if solution is not None:
+                return solution
         return None
 
-    def solution(self):
+    def _search_limited(self, limit: int):
+        """
+        Does a DFS for a solution of at most `limit` moves
+        Returns (solution, None) if one is found
+        Otherwise returns (None, bound) where bound is a proven lower bound
+        on the moves needed, which is then stored in the transposition table
+        """
+        self._check_cancelled()
+        bound = max(self._lower_bound(), self.tt.get(self.hash, 0))
+        if bound > limit:
+            return None, bound
+        bound = self.UNSOLVABLE
+        mark = len(self._trail)
+        for move in self._order_moves(self.generate_moves()):
+            # Make move
+            self.swap(*move)
+
+            # If the puzzle is solved, return the move
+            if self.is_solved():
+                self._learn(move, True)
+                return [move], None
+
+            # If a solution is found, return the moves
+            solution, child_bound = self._search_limited(limit - 1)
+            if solution is not None:
+                self._learn(move, True)
+                solution.append(move)
+                return solution, None
+            if child_bound == self.UNSOLVABLE:
+                self._learn(move, False)
+            bound = min(bound, child_bound + 1)
+
+            # Undo move
+            self._undo(mark)
+        self.tt.store(self.hash, bound)
+        return None, bound
+
+    def solutions(self):
+        """
+        Yields every solution as it is found, each a list of moves with the
+        last move first
+        The board must not be changed while the generator is suspended,
+        it is put back as it was once the generator finishes or is closed
+        """
+        mark = len(self._trail)
+        try:
+            yield from self._enumerate([])
+        finally:
+            self._undo(mark)
+
+    def _enumerate(self, moves: list):
+        """
+        Yields every solution from this board, `moves` are the moves made so far
+        Subtrees known to have no solutions are skipped, and subtrees found
+        to have none are stored as `UNSOLVABLE`
+        """
+        if self.tt.get(self.hash, 0) == self.UNSOLVABLE or self.is_dead():
+            return
+        found = False
+        mark = len(self._trail)
+        for move in self.generate_moves():
+            self.swap(*move)
+            moves.append(move)
+            if self.is_solved():
+                found = True
+                yield moves[::-1]
+            else:
+                for solution in self._enumerate(moves):
+                    found = True
+                    yield solution
+            moves.pop()
+            self._undo(mark)
+        if not found:
+            self.tt.store(self.hash, self.UNSOLVABLE)
+
+    def count_solutions(self, limit: int | None = None) -> int:
+        """
+        Counts the solutions to the grid
+        param `limit` default None
+            if given, stops counting once `limit` solutions are found
+        Counts are stored in the transposition table, so a board reached
+        again through other moves is only counted once
+        """
+        if limit is not None and limit <= 0:
+            return 0
+        mark = len(self._trail)
+        try:
+            return self._count(limit)
+        finally:
+            self._undo(mark)
+
+    def _count(self, limit: int | None) -> int:
+        """
+        Counts the solutions from this board, at most `limit` if given
+        The table stores (count, exact), exact being False when counting
+        stopped at the limit, so the count is only a lower bound
+        """
+        if self.tt.get(self.hash, 0) == self.UNSOLVABLE or self.is_dead():
+            return 0
+        key = ("count", self.hash)
+        stored = self.tt.get(key)
+        if stored is not None:
+            count, exact = stored
+            if limit is None and exact:
+                return count
+            if limit is not None and (exact or count >= limit):
+                return min(count, limit)
+        total = 0
+        mark = len(self._trail)
+        for move in self.generate_moves():
+            self.swap(*move)
+            if self.is_solved():
+                total += 1
+            else:
+                total += self._count(None if limit is None else limit - total)
+            self._undo(mark)
+            if limit is not None and total >= limit:
+                self.tt.store(key, (total, False))
+                return total
+        # Only a board whose every move was tried can be known to be unsolvable
+        self.tt.store(key, (total, True))
+        if total == 0:
+            self.tt.store(self.hash, self.UNSOLVABLE)
+        return total
+
+    def _split_root(self, plies: int) -> list:
+        """
+        Lists every sequence of up to `plies` moves from this board in DFS order
+        Each entry is (moves, solved), a sequence stops early if it solves the grid
+        """
+        out = []
+        def expand(prefix, depth):
+            mark = len(self._trail)
+            for move in self._order_moves(self.generate_moves()):
+                self.swap(*move)
+                if self.is_solved():
+                    out.append((prefix + [move], True))
+                elif depth == 1:
+                    out.append((prefix + [move], False))
+                else:
+                    expand(prefix + [move], depth - 1)
+                self._undo(mark)
+        expand([], plies)
+        return out
+
+    def _solve_parallel(self, shortest: bool, workers: int):
+        """
+        Splits the first one or two plies of the search between `workers` processes
+        In shortest mode every IDA* iteration is split, and the solution of the
+        earliest subtree (in DFS order) wins, so the result is the same as a
+        single process search; otherwise the first solution found wins
+        The "history" move order is learnt per process, so it is left out in
+        shortest mode to keep the result the same on every run
+        """
+        if self.is_dead():
+            return None
+        plies = 1 if len(self.generate_moves()) >= 2 * workers else 2
+        subtrees = self._split_root(plies)
+        if not shortest:
+            for prefix, solved in subtrees:
+                if solved:
+                    return prefix[::-1]
+
+        options = {
+            "tt_size": self.tt.max_entries,
+            "dead_state_checks": self.dead_state_checks,
+            "backend": self.backend,
+            "move_order": [o for o in self.move_order if not shortest or o != "history"]
+        }
+        ctx = multiprocessing.get_context()
+        stop = ctx.Event()
+        best = ctx.Value('i', len(subtrees))
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_match3_worker, \
+                initargs=(self.g, options, stop, best)) as pool:
+            if not shortest:
+                futures = [pool.submit(_match3_subtree, i, prefix, None) \
+                           for i, (prefix, _) in enumerate(subtrees)]
+                for future in as_completed(futures):
+                    i, solution, _ = future.result()
+                    if solution is not None:
+                        stop.set()
+                        pool.shutdown(cancel_futures=True)
+                        return solution + subtrees[i][0][::-1]
+                return None
+
+            limit = self._lower_bound()
+            while limit < self.UNSOLVABLE:
+                best.value = len(subtrees)
+                next_limit = self.UNSOLVABLE
+                for i, (prefix, solved) in enumerate(subtrees):
+                    if solved and len(prefix) <= limit:
+                        best.value = i
+                        break
+                    if solved:
+                        next_limit = min(next_limit, len(prefix))
+                futures = [pool.submit(_match3_subtree, i, prefix, limit - len(prefix)) \
+                           for i, (prefix, solved) in enumerate(subtrees) \
+                           if not solved and i < best.value]
+                solutions = {}
+                for future in futures:
+                    i, solution, bound = future.result()
+                    if solution is not None:
+                        solutions[i] = solution
+                    elif bound is not None:
+                        next_limit = min(next_limit, bound + len(subtrees[i][0]))
+                i = best.value
+                if i < len(subtrees):
+                    return solutions.get(i, []) + subtrees[i][0][::-1]
+                limit = next_limit
+            return None
+
+    def solution(self, shortest = False, workers = 1):
         """
         Prints a solution to the grid to console
+        param `shortest` default False
+            if True, prints a solution with as few moves as possible
+        param `workers` default 1
+            the number of processes to search with
         """
-        s = self.solve()
+        s = self.solve(shortest, workers)
         print("Solution:")
         for i in range(len(s)):
             print(i,":",s[-1-i])
 
+_match3_worker = None
+
+def _init_match3_worker(grid, options, stop, best):
+    """
+    Sets up a process of a parallel Match3 search
+    Each process keeps one Match3 (and its transposition table) for all its subtrees
+    `options` are the keyword arguments to create it with
+    """
+    global _match3_worker
+    _match3_worker = (Match3(grid, **options), stop, best)
+
+def _match3_subtree(index: int, prefix: list, limit: int | None):
+    """
+    Searches the subtree after the moves in `prefix`
+    If `limit` is None does a DFS, otherwise a search of at most `limit` moves
+    Returns (index, solution, bound), with both None if it was cancelled
+    """
+    m, stop, best = _match3_worker
+    m._cancelled = lambda: stop.is_set() or best.value < index
+    try:
+        for move in prefix:
+            m.swap(*move)
+        if limit is None:
+            solution, bound = m._dfs(), None
+        else:
+            solution, bound = m._search_limited(limit)
+        if solution is not None:
+            with best.get_lock():
+                best.value = min(best.value, index)
+        return index, solution, bound
+    except SearchCancelled:
+        return index, None, None
+    finally:
+        m._undo(0)
+
 class RuleEnum(Enum):
     """
     enum for rules available
@@ -247,7 +1134,13 @@ class Rule():
         """
         if not self.rule_values['pattern']:
             return
+        self.rule_values['patterns'] = self.pattern_variants(self.rule_values['pattern'])
 
+    @staticmethod
+    def symmetries(pattern: list[list]) -> list[list[list]]:
+        """
+        Gets the 8 rotations and reflections of a 2d array, always in the same order
+        """
         def rot90(l):
             """
             Rotates a 2d array 90* clockwise
@@ -260,7 +1153,6 @@ class Rule():
             """
             return list(map(list, zip(*l)))
 
-        pattern = self.rule_values['pattern']
         # Create pattern variants
         list_of_patterns = []
         list_of_patterns.append(pattern)
@@ -269,13 +1161,18 @@ class Rule():
             pattern = rot90(pattern)
             list_of_patterns.append(pattern)
             list_of_patterns.append(transpose(pattern))
+        return list_of_patterns
+
+    @staticmethod
+    def pattern_variants(pattern: list[list]) -> list[list[list]]:
+        """
+        Gets the rotations and reflections of a pattern, without duplicates
+        """
+        list_of_patterns = Rule.symmetries(pattern)
 
         # Remove duplicates
         list_of_patterns.sort()
-        list_of_patterns = list(k for k,_ in groupby(list_of_patterns))
-
-        # Add to rule values
-        self.rule_values['patterns'] = list_of_patterns
+        return list(k for k,_ in groupby(list_of_patterns))
 
     def __repr__(self):
         out = f"Rule of type {RuleEnum(self.rule_type)} with values"
@@ -367,19 +1264,75 @@ class LogicGrid():
 
     param `rules`: a list of rules provided about the puzzle
 
+    param `cell_order` default None
+        the heuristics (one or a list of `CELL_ORDERS`) picking the EMPTY
+        cell to branch on next, most constrained first, None keeps row major order
+        "clues" prefers cells next to cells with info (numbers, letters...)
+        "patterns" prefers cells in the most complete pattern places
+        "bottleneck" prefers cells whose loss would split a colour that must connect
+        "mrv" prefers cells that can't be one of the colours (fewest values left)
+
+    param `cache` default None
+        a `SolutionCache` solutions are looked up in and stored to, grids
+        that are rotations or reflections of each other share an entry
+        (cell info is taken to look the same from every side)
+
+    param `backend` default "python"
+        "bitboard" also keeps one int bitmask per colour, cell (x, y) being
+        bit x * (width + 1) + y, and runs the pattern, region size and
+        connectivity checks on it with shifts
+        `g` stays a view of the same colours, read into the bitmasks
+        when solving starts and kept in step by every assignment
+
     func `solution` prints a solution to the LogicGrid puzzle to console
+    func `solutions` yields every solution, `count_solutions` counts them
     """
+    STEAL_INTERVAL = 16
+    # Rules that depend on how far regions can still grow
+    REACH_RULES = (RuleEnum.AREA_NUMBER, RuleEnum.AREA_NUMBERS_ARE_ONE_OFF, \
+                   RuleEnum.N_CELLS_PER_REGION, RuleEnum.LETTER_SORTED)
+    CELL_ORDERS = ("clues", "patterns", "bottleneck", "mrv")
+
     def __init__(self, grid: list[list[LogicGridCell]], rules: list[Rule] = [], \
-                 linked_cells: list[list[(int, int)]] = []):
+                 linked_cells: list[list[(int, int)]] = [], backend: str = "python", \
+                 cell_order = None, cache: SolutionCache = None):
+        if backend not in ("python", "bitboard"):
+            raise ValueError(f"Unknown backend {backend}")
+        if isinstance(cell_order, str):
+            cell_order = [cell_order]
+        for order in cell_order or []:
+            if order not in self.CELL_ORDERS:
+                raise ValueError(f"Unknown cell order {order}")
+        self.cell_order = list(cell_order or [])
+        self.cache = cache
         self.g = grid
         self.width = len(self.g[0])
         self.height = len(self.g)
         self.attempts = 0
+        self._pattern_witness = {}
+        self._components = {}
+        self._labels = None
+        self._trail = []
+        self._reasons = {}
+        self._conflict = None
+        self._broken = None
+        self._nogoods = {}
+        self._branches = []
+        self._cancelled = None
+        self._steal = None
+        self.backend = backend
+        self._stride = self.width + 1
+        self._bits = None
+        self._origin_masks = {}
+        self._compiled = {}
+        if backend == "bitboard":
+            self._load_bits()
 
         self.rules = rules
         self.linked_cells = linked_cells
         if len(linked_cells) > 0:
             self.sort_linked_cells()
+        self._index_linked_cells()
 
     def __str__(self) -> str:
         out = ""
@@ -434,377 +1387,1723 @@ class LogicGrid():
         """
         self.linked_cells.append(ls)
         self.sort_linked_cells()
+        self._index_linked_cells()
+
+    def _index_linked_cells(self):
+        """
+        Maps each linked cell to the indexes of the groups holding it
+        """
+        self._groups_of = {}
+        for index, ls in enumerate(self.linked_cells):
+            for c in ls:
+                self._groups_of.setdefault(tuple(c), []).append(index)
 
     def _is_pattern_found(self, pattern: list[list[LogicGridCell]] = None, \
-                          patterns: list[list[list[LogicGridCell]]] = None) -> bool:
+                          patterns: list[list[list[LogicGridCell]]] = None, \
+                          cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks if any of the patterns (or any variant of `pattern`) is on the grid
+        If `cells` is given, only the places where one of them is under a
+        cell of the pattern are checked
+        """
         if pattern:
-            def rot90(l):
-                """
-                Rotates a 2d array 90* clockwise
-                """
-                return [list(x) for x in reversed(list(zip(*l)))]
-
-            def transpose(l):
-                """
-                Transposes a list
-                """
-                return list(map(list, zip(*l)))
-
-            # Create pattern variants
-            patterns = []
-            patterns.append(pattern)
-            patterns.append(transpose(pattern))
-            for i in range(3):
-                pattern = rot90(pattern)
-                patterns.append(pattern)
-                patterns.append(transpose(pattern))
-
-            # Remove duplicates
-            patterns.sort()
-            patterns = list(k for k,_ in groupby(patterns))
+            compiled = self._compile_patterns(pattern, True)
+        else:
+            compiled = self._compile_patterns(patterns)
+        if self.backend == "bitboard":
+            return self._is_pattern_found_bits(compiled, cells)
+        for p_height, p_width, care, _ in compiled:
+            for i, j in self._care_windows(p_height, p_width, care, cells):
+                # Colours are singletons, `is` skips the slow Colour.__eq__
+                if all(self.g[i + i_1][j + j_1].col is want for i_1, j_1, want in care):
+                    return True
+        return False
 
-        for p in patterns:
-            p_height = len(p)
-            p_width = len(p[0])
+    def _compile_patterns(self, patterns, variants = False) -> list[tuple]:
+        """
+        Compiles patterns once, they are cached by identity after
+        param `variants` default False
+            if True, `patterns` is one pattern, whose variants are compiled
+        Each pattern becomes (height, width, care, offsets)
+            `care` is the (row, column, colour) of each cell that isn't EMPTY
+            `offsets` is the (bit offset, colour value) of the same cells,
+            for the bitboards
+        """
+        key = id(patterns)
+        if key not in self._compiled:
+            compiled = []
+            for p in (Rule.pattern_variants(patterns) if variants else patterns):
+                care = tuple((i_1, j_1, p[i_1][j_1].col) for i_1 in range(len(p)) \
+                             for j_1 in range(len(p[0])) if p[i_1][j_1].col != Colour.EMPTY)
+                offsets = tuple((i_1 * self._stride + j_1, want.value) for i_1, j_1, want in care)
+                compiled.append((len(p), len(p[0]), care, offsets))
+            # Keep `patterns` so its id can't be reused
+            self._compiled[key] = (patterns, compiled)
+        return self._compiled[key][1]
+
+    def _care_windows(self, p_height: int, p_width: int, care: tuple, \
+                      cells: list[tuple[int, int]] = None):
+        """
+        Yields the top left corner of every place a pattern fits on the grid
+        If `cells` is given, only the places putting one of the `care`
+        cells of the pattern on one of them
+        """
+        if cells is None:
             for i in range(self.height - p_height + 1):
                 for j in range(self.width - p_width + 1):
-                    p_matches = True
-                    for i_1 in range(p_height):
-                        for j_1 in range(p_width):
-                            if p[i_1][j_1].col == Colour.EMPTY:
-                                continue
-                            elif self.g[i + i_1][j + j_1].col != p[i_1][j_1].col:
-                                p_matches = False
-                                break
-                        if not p_matches:
-                            break
-                    if p_matches:
-                        return True
-        return False
-
-    def _do_all_of_colour_connect(self, colour: int) -> bool:
-        #print("Colour =",colour)
-        #print(repr(self))
-        # Function to perform DFS and mark visited 1s
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # Right, Down, Left, Up
-        def dfs(x, y, visited):
-            if x < 0 or y < 0 or x >= self.height or y >= self.width:
-                return
-            if self.g[x][y].col not in (colour, Colour.EMPTY) or visited[x][y]:
-                return
-            visited[x][y] = True
-            for dx, dy in directions:
-                dfs(x + dx, y + dy, visited)
-
-        # Find the first '1' to start the DFS
-        start = None
+                    yield i, j
+            return
+        seen = set()
+        for x, y in cells:
+            for i_1, j_1, _ in care:
+                i, j = x - i_1, y - j_1
+                if 0 <= i <= self.height - p_height and 0 <= j <= self.width - p_width \
+                   and (i, j) not in seen:
+                    seen.add((i, j))
+                    yield i, j
+
+    def _load_bits(self) -> None:
+        """
+        Reads the colours of the grid into one bitmask per colour
+        The spare bit ending each row stops shifts wrapping onto the next row
+        """
+        self._bits = {c.value: 0 for c in Colour}
         for i in range(self.height):
             for j in range(self.width):
-                if self.g[i][j].col == colour:
-                    start = (i, j)
-                    break
-            if start:
-                break
+                self._bits[self.g[i][j].col.value] |= 1 << (i * self._stride + j)
 
-        if not start:
-            return True  # No '1's in the self.g, considered as connected
+    def _grow(self, seed: int, within: int) -> int:
+        """
+        Floods out from the bits of `seed` through the bits of `within`
+        """
+        s = self._stride
+        region = seed
+        while True:
+            grown = (region | region << 1 | region >> 1 | region << s | region >> s) & within
+            if grown == region:
+                return region
+            region = grown
 
-        # Initialize visited array and start DFS from the first '1'
-        visited = [[False for _ in range(self.width)] for _ in range(self.height)]
-        dfs(start[0], start[1], visited)
+    def _region_bits(self, colour: Colour, cells: list[tuple[int, int]] = None, \
+                     walled = False):
+        """
+        Yields the regions of `colour` as bitmasks
+        If `cells` is given, only the regions holding them or a cell next to them
+        param `walled` default False
+            if True, with `cells` also the regions that could reach one of them,
+            through EMPTY cells, before it was coloured the other colour
+        """
+        s = self._stride
+        within = self._bits[colour.value]
+        if cells is None:
+            seeds = within
+        else:
+            seeds = 0
+            for x, y in cells:
+                bit = 1 << (x * s + y)
+                seeds |= bit | bit << 1 | bit >> 1 | bit << s | bit >> s
+            seeds &= within
+            if walled and colour in (Colour.WHITE, Colour.BLACK):
+                room = within | self._bits[Colour.EMPTY.value]
+                near = 0
+                for x, y in cells:
+                    if self.g[x][y].col == self._opposite(colour):
+                        bit = 1 << (x * s + y)
+                        near |= bit << 1 | bit >> 1 | bit << s | bit >> s
+                seeds |= self._grow(near & room, room) & within
+        while seeds:
+            region = self._grow(seeds & -seeds, within)
+            seeds &= ~region
+            yield region
+
+    def _origins(self, p_height: int, p_width: int) -> int:
+        """
+        Gets the bitmask of the top left corners a pattern of that size fits at
+        """
+        key = (p_height, p_width)
+        if key not in self._origin_masks:
+            mask = 0
+            if p_height <= self.height and p_width <= self.width:
+                row = (1 << (self.width - p_width + 1)) - 1
+                for i in range(self.height - p_height + 1):
+                    mask |= row << (i * self._stride)
+            self._origin_masks[key] = mask
+        return self._origin_masks[key]
+
+    def _is_pattern_found_bits(self, compiled: list[tuple], \
+                               cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks if any of the compiled patterns is on the grid, testing every
+        place at once by shifting the bitmask of each colour under each pattern cell
+        If `cells` is given, only the places where one of them is under a
+        cell of the pattern are checked
+        """
+        changed = 0
+        for x, y in cells or []:
+            changed |= 1 << (x * self._stride + y)
+        for p_height, p_width, _, offsets in compiled:
+            found = self._origins(p_height, p_width)
+            if cells is not None:
+                near = 0
+                for offset, _ in offsets:
+                    near |= changed >> offset
+                found &= near
+            for offset, value in offsets:
+                if not found:
+                    break
+                found &= self._bits[value] >> offset
+            if found:
+                return True
+        return False
 
-        # Check if all '1's are visited
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.g[i][j].col == colour and not visited[i][j]:
-                    #print(f"Cell ({i}, {j}) not visited")
-                    #print()
-                    return False
-        return True
+    def _pattern_windows(self, p: list[list[LogicGridCell]]):
+        """
+        Yields the top left corner of every place pattern `p` fits on the grid
+        """
+        return self._care_windows(len(p), len(p[0]), ())
 
-    def _check_area_numbers(self, one_off = False) -> bool:
-        def dfs(x: int, y: int, num: int, one_off: bool):
-            stack = [(x, y)]
-            visited = []
-            cells_in_area = 0
-            colour = self.g[x][y].col
-
-            while stack:
-                e = stack.pop(0)
-                if e in visited:
-                    continue
-                visited.append(e)
-                if self.g[e[0]][e[1]].col != colour:
+    def _does_window_match(self, p: list[list[LogicGridCell]], i: int, j: int, \
+                           allow_empty = False) -> bool:
+        """
+        Checks if pattern `p` matches the grid with its top left corner at (i, j)
+        EMPTY cells of the pattern match anything
+        param `allow_empty` default False
+            if True, EMPTY cells of the grid match any colour too,
+            i.e. the pattern could still be completed there
+            (an EMPTY cell can never become NA)
+        """
+        for i_1 in range(len(p)):
+            for j_1 in range(len(p[0])):
+                want = p[i_1][j_1].col
+                if want == Colour.EMPTY:
                     continue
-                cells_in_area += 1
-                if one_off:
-                    if cells_in_area > num + 1:
-                        break
+                col = self.g[i + i_1][j + j_1].col
+                if col != want and not (allow_empty and col == Colour.EMPTY and want != Colour.NA):
+                    return False
+        return True
 
-                # Add orthogonal cells to stack
-                if e[0] - 1 >= 0: # cell above
-                    if self.g[e[0] - 1][e[1]].col == colour:
-                        new_e = (e[0] - 1, e[1])
-                        if new_e not in visited:
-                            stack.append(new_e)
-                if e[0] + 1 < self.height: # Cell below
-                    if self.g[e[0] + 1][e[1]].col == colour:
-                        new_e = (e[0] + 1, e[1])
-                        if new_e not in visited:
-                            stack.append(new_e)
-                if e[1] - 1 >= 0: # cell to the left
-                    if self.g[e[0]][e[1] - 1].col == colour:
-                        new_e = (e[0], e[1] - 1)
-                        if new_e not in visited:
-                            stack.append(new_e)
-                if e[1] + 1 < self.width: # cell to the right
-                    if self.g[e[0]][e[1] + 1].col == colour:
-                        new_e = (e[0], e[1] + 1)
-                        if new_e not in visited:
-                            stack.append(new_e)
-
-            if one_off:
-                return (cells_in_area == num - 1) or (cells_in_area == num + 1)
-            else:
-                return cells_in_area == num
+    def _can_pattern_be_found(self, index: int, patterns: list[list[list[LogicGridCell]]], \
+                              cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks if any of the patterns could still be completed somewhere on the grid
+        The place found is remembered for rule `index`, and is only looked
+        for again once one of `cells` lands inside it
+        """
+        if index in self._pattern_witness:
+            p, i, j = self._pattern_witness[index]
+            if cells is not None and not any(i <= x < i + len(p) and j <= y < j + len(p[0]) \
+                                             for x, y in cells):
+                return True
+            if self._does_window_match(p, i, j, True):
+                return True
+        for p in patterns:
+            for i, j in self._pattern_windows(p):
+                if self._does_window_match(p, i, j, True):
+                    self._pattern_witness[index] = (p, i, j)
+                    return True
+        return False
 
-        for i in range(self.height):
-            for j in range(self.width):
-                if "number" in self.g[i][j].inf:
-                    # Now need to do a dfs from here
-                    res = dfs(i, j, self.g[i][j]["number"], one_off)
-                    if not res:
+    def _neighbours(self, x: int, y: int):
+        """
+        Yields the cells orthogonally next to (x, y)
+        """
+        if x > 0:
+            yield x - 1, y
+        if x < self.height - 1:
+            yield x + 1, y
+        if y > 0:
+            yield x, y - 1
+        if y < self.width - 1:
+            yield x, y + 1
+
+    def _region(self, x: int, y: int) -> set[tuple[int, int]]:
+        """
+        Returns the cells in the same colour region as (x, y)
+        """
+        colour = self.g[x][y].col
+        region = {(x, y)}
+        stack = [(x, y)]
+        while stack:
+            e = stack.pop()
+            for n in self._neighbours(*e):
+                if n not in region and self.g[n[0]][n[1]].col == colour:
+                    region.add(n)
+                    stack.append(n)
+        return region
+
+    def _regions_to_check(self, cells: list[tuple[int, int]] = None, colour: Colour = None):
+        """
+        Yields colour regions (sets of cells) of the grid, each once
+        If `cells` is given, only the regions holding them or a cell next to
+        them, which are the only regions that changed when they were coloured
+        param `colour` default None
+            if given, only regions of this colour
+        """
+        if cells is None:
+            starts = [(i, j) for i in range(self.height) for j in range(self.width)]
+        else:
+            starts = set()
+            for x, y in cells:
+                starts.add((x, y))
+                starts.update(self._neighbours(x, y))
+        seen = set()
+        for x, y in starts:
+            if (x, y) in seen or (colour is not None and self.g[x][y].col != colour):
+                continue
+            region = self._region(x, y)
+            seen |= region
+            yield region
+
+    def _info(self, x: int, y: int, key: str):
+        """
+        Gets the `key` info of cell (x, y), None if it has none
+        """
+        inf = self.g[x][y].inf
+        if inf and key in inf:
+            return inf[key]
+        return None
+
+    def _connect_labels(self, colour: Colour) -> list[int]:
+        """
+        Labels the cells `colour` can pass through (cells of that colour or EMPTY)
+        by the component they are in, using union-find
+        Returns the label of each cell, indexed by x * width + y, -1 if it is blocked
+        """
+        w = self.width
+        parent = list(range(self.height * w))
+
+        def find(a):
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            return a
+
+        passable = [self.g[i][j].col in (colour, Colour.EMPTY) \
+                    for i in range(self.height) for j in range(w)]
+        for a, open_cell in enumerate(passable):
+            if not open_cell:
+                continue
+            if a % w and passable[a - 1]:
+                parent[find(a - 1)] = find(a)
+            if a >= w and passable[a - w]:
+                parent[find(a - w)] = find(a)
+        return [find(a) if open_cell else -1 for a, open_cell in enumerate(passable)]
+
+    def _do_all_of_colour_connect(self, colour: Colour, \
+                                  cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks all cells of `colour` could still be connected, through
+        cells of that colour or EMPTY cells
+        The components are labelled once and kept until a backtrack
+        If `cells` is given (and the check passed before they were coloured),
+        they are checked against the kept labels, which are only
+        rebuilt if one of them could have split a component
+        The bitboard backend floods from one cell of `colour` instead
+        """
+        if self.backend == "bitboard":
+            same = self._bits[colour.value]
+            if not same:
+                return True
+            reach = self._grow(same & -same, same | self._bits[Colour.EMPTY.value])
+            return not same & ~reach
+        kept = self._components.get(colour.value)
+        if cells is not None and kept is not None:
+            labels, root = kept
+            for x, y in cells:
+                col = self.g[x][y].col
+                if col == colour:
+                    if root is None:
+                        root = labels[x * self.width + y]
+                    elif labels[x * self.width + y] != root:
                         return False
+                    continue
+                # A cell of another colour with at most one open neighbour can
+                # not split the cells around it apart, the other cells just
+                # coloured count as open, as together they could
+                open_neighbours = sum(1 for n in self._neighbours(x, y) \
+                    if n in cells or self.g[n[0]][n[1]].col in (colour, Colour.EMPTY))
+                if open_neighbours > 1:
+                    break
+            else:
+                kept[1] = root
+                return True
 
-    def _n_symbols_per_colour_area(self, number_of_symbols: int, col: Colour) -> bool:
-        def dfs(x: int, y: int, num_symbols: int) -> bool:
-            stack = [(x, y)]
-            visited = []
-            colour = self.g[x][y].col
-            symbols_in_area = 0
+        labels = self._connect_labels(colour)
+        roots = {labels[i * self.width + j] for i in range(self.height) \
+                 for j in range(self.width) if self.g[i][j].col == colour}
+        if len(roots) > 1:
+            return False
+        self._components[colour.value] = [labels, next(iter(roots), None)]
+        return True
 
+    def _label_regions(self, cells: list[tuple[int, int]] = None):
+        """
+        Labels the colour regions of the grid in one pass, shared by every
+        region rule checked in the same `_test_rules` call
+        If `cells` is given, only the regions holding them or a cell next to
+        them, which are the only regions that changed when they were coloured,
+        and if a rule needs it the regions `_walled_in` by them
+        Returns (labels, regions), `labels` mapping each cell labelled to the
+        index of its region, each region being
+        (colour, cells, number of cells with info, numbers, letters)
+        """
+        if self._labels is not None and self._labels[0] is cells:
+            return self._labels[1], self._labels[2]
+        if cells is None:
+            starts = [(i, j) for i in range(self.height) for j in range(self.width)]
+        else:
+            starts = []
+            for x, y in cells:
+                starts.append((x, y))
+                starts.extend(self._neighbours(x, y))
+            if any(rule.rule_type in self.REACH_RULES for rule in self.rules):
+                starts.extend(self._walled_in(cells))
+        labels = {}
+        regions = []
+        for x, y in starts:
+            if (x, y) in labels:
+                continue
+            index = len(regions)
+            colour = self.g[x][y].col
+            region = [(x, y)]
+            labels[(x, y)] = index
+            symbols = 0
+            numbers = set()
+            letters = set()
+            for a, b in region:
+                inf = self.g[a][b].inf
+                if inf is not None:
+                    symbols += 1
+                    if inf and "number" in inf:
+                        numbers.add(inf["number"])
+                    if inf and "letter" in inf:
+                        letters.add(inf["letter"])
+                for n in self._neighbours(a, b):
+                    if n not in labels and self.g[n[0]][n[1]].col == colour:
+                        labels[n] = index
+                        region.append(n)
+            regions.append((colour, region, symbols, numbers, letters))
+        self._labels = (cells, labels, regions)
+        return labels, regions
+
+    def _walled_in(self, cells: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """
+        Gets the WHITE and BLACK cells that could reach one of `cells`, through
+        cells of their colour or EMPTY, before it was coloured the other colour
+        Their regions are the ones colouring `cells` took room to grow from
+        """
+        found = []
+        seen = set()
+        for x, y in cells:
+            colour = self.g[x][y].col
+            if colour not in (Colour.WHITE, Colour.BLACK):
+                continue
+            other = self._opposite(colour)
+            stack = [(x, y)]
             while stack:
-                e = stack.pop()
-                if e in visited:
-                    continue
-                visited.append(e)
-                # Update values
-                if self.g[e[0]][e[1]].inf is not None:
-                    symbols_in_area += 1
-                    if symbols_in_area > num_symbols:
-                        #print(f'{e[0]},{e[1]}')
-                        return False
+                for n in self._neighbours(*stack.pop()):
+                    col = self.g[n[0]][n[1]].col
+                    if (n, other.value) in seen or col not in (other, Colour.EMPTY):
+                        continue
+                    seen.add((n, other.value))
+                    stack.append(n)
+                    if col == other:
+                        found.append(n)
+        return found
 
-                # Add orthogonal cells to stack
-                if e[0] - 1 >= 0: # cell above
-                    if self.g[e[0] - 1][e[1]].col == colour:
-                        stack.append((e[0] - 1, e[1]))
-                if e[0] + 1 < self.height: # Cell below
-                    if self.g[e[0] + 1][e[1]].col == colour:
-                        stack.append((e[0] + 1, e[1]))
-                if e[1] - 1 >= 0: # cell to the left
-                    if self.g[e[0]][e[1] - 1].col == colour:
-                        stack.append((e[0], e[1] - 1))
-                if e[1] + 1 < self.width: # cell to the right
-                    if self.g[e[0]][e[1] + 1].col == colour:
-                        stack.append((e[0], e[1] + 1))
+    def _can_grow_to(self, region: list[tuple[int, int]], colour: Colour, size: int) -> bool:
+        """
+        Checks if a region of `colour` can still grow to `size` cells,
+        through the EMPTY cells (and other regions of `colour`) around it
+        Only WHITE and BLACK regions grow, EMPTY cells never become NA
+        """
+        if len(region) >= size:
             return True
+        if colour not in (Colour.WHITE, Colour.BLACK):
+            return False
+        reach = set(region)
+        stack = list(region)
+        while stack:
+            for n in self._neighbours(*stack.pop()):
+                if n not in reach and self.g[n[0]][n[1]].col in (colour, Colour.EMPTY):
+                    reach.add(n)
+                    if len(reach) >= size:
+                        return True
+                    stack.append(n)
+        return False
 
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.g[i][j].inf is not None and self.g[i][j].col == col:
-                    if not dfs(i, j, number_of_symbols):
-                        return False
-        return True
-
-    def _n_cells_per_region(self, number: int, col: Colour) -> bool:
-        visited = []
-        stack = []
-        count = 0
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.g[i][j].col != col:
-                    continue
-                if (i, j) in visited:
-                    continue
-                # At an unvisited cell, must check all cells around it to see if how big area is
-                count = 1
-                if j < self.width - 1: # Add cell to right
-                    stack.append((i, j + 1))
-                if i < self.height - 1: # Add cell below
-                    stack.append((i + 1, j))
-                while stack:
-                    s = stack.pop()
-                    visited.append(s)
-                    if self.g[s[0]][s[1]].col != col:
-                        continue
-                    count += 1
-                    if count > number: # Too many in region
-                        return False
-                    # Add surrounding cells to stack
-                    if s[1] < self.width - 1: # Add cell to right
-                        stack.append((s[0], s[1] + 1))
-                    if s[1] > 0: # Add cell to left
-                        stack.append((s[0], s[1] - 1))
-                    if s[0] < self.height - 1: # Add cell below
-                        stack.append((i + 1, j))
-                    if s[0] > 0: # Add cell above
-                        stack.append((i - 1, j))
-                if count < number: # Not enough in region
+    def _wrong_size(self, colour: Colour, region: list[tuple[int, int]], sizes: tuple, \
+                    explain = False, anchor: tuple[int, int] = None):
+        """
+        Checks if a region of `colour` is certain to end up a size not in `sizes`,
+        because it is already too big, or walled in too small
+        Regions only grow as EMPTY cells are coloured, so until then it passes
+        Returns None if it could still be one of `sizes`, otherwise True
+        param `explain` default False
+            if True, returns the cells whose colours make it certain instead of True
+        param `anchor` default None
+            the cell of the region the sizes are for, if not any of them
+        """
+        if colour == Colour.EMPTY:
+            return None
+        bigger = [size for size in sizes if size >= len(region)]
+        if bigger and self._can_grow_to(region, colour, min(bigger)):
+            return None
+        if not explain:
+            return True
+        if not bigger:
+            return list(region)
+        anchor = anchor or region[0]
+        walls = set()
+        if colour in (Colour.WHITE, Colour.BLACK):
+            walls = self._walled_area(anchor, colour)[1]
+        # The region's own cells are only needed if it is past one of `sizes`
+        if len(region) > min(sizes):
+            return list(region) + list(walls)
+        return [anchor] + list(walls)
+
+    def _check_area_numbers(self, one_off = False, cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks each numbered cell can still be in a region of that many cells
+        param `one_off` default False
+            if True, the region must be one cell bigger or smaller instead
+        If `cells` is given, only the regions they changed are checked
+        """
+        for colour, region, _, numbers, _ in self._label_regions(cells)[1]:
+            for num in numbers:
+                sizes = (num - 1, num + 1) if one_off else (num,)
+                if self._wrong_size(colour, region, sizes) is not None:
                     return False
         return True
 
-    def _are_letters_sorted(self) -> bool:
-        true_visited = []
-        def dfs(x: int, y: int, letter: str):
-            stack = [(x, y)]
-            visited = []
-            colour = self.g[x][y].col
-
-            while stack:
-                e = stack.pop(0)
-                if e in visited:
-                    continue
-                visited.append(e)
-                if self.g[e[0]][e[1]].col != colour:
-                    continue
-                true_visited.append(e)
-                if "letter" in self.g[e[0]][e[1]].inf:
-                    if self.g[e[0]][e[1]]["letter"] != letter:
-                        return False
-
-                # Add orthogonal cells to stack
-                if e[0] - 1 >= 0: # cell above
-                    new_e = (e[0] - 1, e[1])
-                    if new_e not in visited:
-                        stack.append(new_e)
-                if e[0] + 1 < self.height: # Cell below
-                    new_e = (e[0] + 1, e[1])
-                    if new_e not in visited:
-                        stack.append(new_e)
-                if e[1] - 1 >= 0: # cell to the left
-                    new_e = (e[0], e[1] - 1)
-                    if new_e not in visited:
-                        stack.append(new_e)
-                if e[1] + 1 < self.width: # cell to the right
-                    new_e = (e[0], e[1] + 1)
-                    if new_e not in visited:
-                        stack.append(new_e)
+    def _n_symbols_per_colour_area(self, number_of_symbols: int, col: Colour, \
+                                   cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks no region of colour `col` holds more than `number_of_symbols` symbols
+        If `cells` is given, only the regions they changed are checked
+        """
+        for colour, _, symbols, _, _ in self._label_regions(cells)[1]:
+            if colour == col and symbols > number_of_symbols:
+                return False
+        return True
 
+    def _n_cells_per_region(self, number: int, col: Colour, \
+                            cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks every region of colour `col` can still have exactly `number` cells
+        If `cells` is given, only the regions they changed are checked
+        """
+        if self.backend == "bitboard":
+            within = self._bits[col.value]
+            if col in (Colour.WHITE, Colour.BLACK):
+                within |= self._bits[Colour.EMPTY.value]
+            for region in self._region_bits(col, cells, True):
+                size = region.bit_count()
+                if size > number or \
+                   (size < number and self._grow(region, within).bit_count() < number):
+                    return False
             return True
+        for colour, region, _, _, _ in self._label_regions(cells)[1]:
+            if colour == col and self._wrong_size(colour, region, (number,)) is not None:
+                return False
+        return True
 
-        letters_searched = []
+    def _letter_conflict(self, cells: list[tuple[int, int]] = None):
+        """
+        Finds cells whose colours alone break LETTER_SORTED, a region holding
+        two letters, or two cells with the same letter that can never be in one region
+        (different colours, or walled apart)
+        If `cells` is given, only the letters in regions they changed are looked at
+        Returns None if the letters can still be sorted
+        """
+        labels, regions = self._label_regions(cells)
+        letters = set()
+        for colour, region, _, _, region_letters in regions:
+            if colour == Colour.EMPTY:
+                continue
+            if len(region_letters) > 1:
+                return list(region)
+            letters |= region_letters
+        if not letters:
+            return None
+        same = {}
         for i in range(self.height):
             for j in range(self.width):
-                if "letter" in self.g[i][j].inf:
-                    # If the letter has been searched already
-                    if self.g[i][j]["letter"] in letters_searched:
-                        if (i, j) not in true_visited:
-                            return False
-                        continue
-                    # Now need to do a dfs from here
-                    res = dfs(i, j, self.g[i][j]["letter"])
-                    if not res:
-                        return False
-                    letters_searched.append(self.g[i][j]["letter"])
-        return True
+                letter = self._info(i, j, "letter")
+                if letter in letters and self.g[i][j].col != Colour.EMPTY:
+                    same.setdefault(letter, []).append((i, j))
+        for spots in same.values():
+            first = spots[0]
+            if labels.get(first) is not None and all(labels.get(c) == labels[first] for c in spots):
+                continue
+            colour = self.g[first[0]][first[1]].col
+            for c in spots:
+                if self.g[c[0]][c[1]].col != colour:
+                    return [first, c]
+            if colour in (Colour.WHITE, Colour.BLACK):
+                reach, walls = self._walled_area(first, colour)
+            else:
+                reach, walls = self._region(*first), set()
+            for c in spots:
+                if c not in reach:
+                    return [first, c] + list(walls)
+        return None
 
-    def _test_rules(self) -> bool:
-        for rule in self.rules:
-            if rule.rule_type in [RuleEnum.MATCH_PATTERN, RuleEnum.MATCH_NOT_PATTERN]:
+    def _are_letters_sorted(self, cells: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks no region holds two different letters,
+        and all cells with the same letter can still be in one region
+        If `cells` is given, only the letters in regions they changed are checked
+        """
+        return self._letter_conflict(cells) is None
+
+    def _test_rules(self, changed: list[tuple[int, int]] = None) -> bool:
+        """
+        Checks the grid against every rule
+        param `changed` default None
+            the cells coloured since the rules last passed, if given
+            only the parts of the grid they can affect are checked
+        When this returns False, `_broken` holds the rule broken and `changed`
+        """
+        self._labels = None
+        for index, rule in enumerate(self.rules):
+            self._broken = (rule, changed)
+            if rule.rule_type == RuleEnum.MATCH_NOT_PATTERN:
                 if rule.rule_values['patterns'] is not None:
                     is_pattern_found = self._is_pattern_found( \
-                        patterns = rule.rule_values["patterns"])
+                        patterns = rule.rule_values["patterns"], cells = changed)
                 else:
                     is_pattern_found = self._is_pattern_found( \
-                        pattern = rule.rule_values["pattern"])
-                if (rule.rule_type == RuleEnum.MATCH_PATTERN and not is_pattern_found) or \
-                   (rule.rule_type == RuleEnum.MATCH_NOT_PATTERN and is_pattern_found):
+                        pattern = rule.rule_values["pattern"], cells = changed)
+                if is_pattern_found:
+                    return False
+            elif rule.rule_type == RuleEnum.MATCH_PATTERN:
+                if not self._can_pattern_be_found(index, rule.rule_values["patterns"], changed):
                     return False
             elif rule.rule_type in [RuleEnum.AREA_NUMBER, RuleEnum.AREA_NUMBERS_ARE_ONE_OFF]:
-                if not self._check_area_numbers(rule.rule_type != RuleEnum.AREA_NUMBER):
+                if not self._check_area_numbers(rule.rule_type != RuleEnum.AREA_NUMBER, changed):
                     return False
             elif rule.rule_type == RuleEnum.CONNECT_CELLS:
-                if not self._do_all_of_colour_connect(rule.rule_values["colour"]):
+                if not self._do_all_of_colour_connect(rule.rule_values["colour"], changed):
                     return False
             elif rule.rule_type == RuleEnum.N_CELLS_PER_REGION:
                 num = rule.rule_values["number"]
                 col = rule.rule_values["colour"]
-                if not self._n_cells_per_region(num, col):
+                if not self._n_cells_per_region(num, col, changed):
                     return False
             elif rule.rule_type == RuleEnum.N_SYMBOL_PER_COLOUR:
                 if not self._n_symbols_per_colour_area(rule.rule_values["number"], \
-                                rule.rule_values["colour"]):
+                                rule.rule_values["colour"], changed):
                     return False
             elif rule.rule_type == RuleEnum.LETTER_SORTED:
-                if not self._are_letters_sorted():
+                if not self._are_letters_sorted(changed):
                     return False
         return True
 
-    def _set_linked_cell(self, index: int, colour: Colour):
-        pass
+    def _assign(self, x: int, y: int, colour: Colour, reason: list = None) -> None:
+        """
+        Colours the EMPTY cell (x, y), recording it on the trail
+        param `reason` default None
+            the cells whose colours forced this one, None for a decision
+        """
+        self.g[x][y].col = colour
+        self._reasons[(x, y)] = reason
+        if self._bits is not None:
+            bit = 1 << (x * self._stride + y)
+            self._bits[Colour.EMPTY.value] ^= bit
+            self._bits[colour.value] |= bit
+        self._trail.append((x, y))
+
+    def _undo(self, mark: int) -> None:
+        """
+        Resets every cell coloured since the trail was `mark` long back to EMPTY
+        Connectivity labels are dropped, as cells opened up can join components
+        """
+        if len(self._trail) > mark:
+            self._components.clear()
+        while len(self._trail) > mark:
+            x, y = self._trail.pop()
+            del self._reasons[(x, y)]
+            if self._bits is not None:
+                bit = 1 << (x * self._stride + y)
+                self._bits[self.g[x][y].col.value] ^= bit
+                self._bits[Colour.EMPTY.value] |= bit
+            self.g[x][y].col = Colour.EMPTY
+
+    def _opposite(self, colour: Colour) -> Colour:
+        """
+        Gets the other colour a cell can be
+        """
+        return Colour.BLACK if colour == Colour.WHITE else Colour.WHITE
+
+    def _deduce_not_pattern(self, patterns: list[list[list[LogicGridCell]]], \
+                            cells: list[tuple[int, int]] = None):
+        """
+        Yields (x, y, colour, reason) for each cell that must be `colour`
+        because the other colour would complete one of the patterns,
+        `reason` being the rest of the pattern's cells
+        If `cells` is given, only the places where one of them is under a
+        cell of the pattern are looked at
+        """
+        for p_height, p_width, care, _ in self._compile_patterns(patterns):
+            for i, j in self._care_windows(p_height, p_width, care, cells):
+                missing = None
+                for i_1, j_1, want in care:
+                    col = self.g[i + i_1][j + j_1].col
+                    if col is want:
+                        continue
+                    if col is not Colour.EMPTY or missing is not None or want is Colour.NA:
+                        break
+                    missing = (i + i_1, j + j_1, want)
+                else:
+                    if missing is not None:
+                        reason = [(i + i_1, j + j_1) for i_1, j_1, _ in care \
+                                  if (i + i_1, j + j_1) != missing[:2]]
+                        yield missing[0], missing[1], self._opposite(missing[2]), reason
+
+    def _pattern_blocker(self, i: int, j: int, care: tuple):
+        """
+        Gets a cell stopping the pattern with `care` cells from ever
+        matching at (i, j), None if it still could
+        """
+        for i_1, j_1, want in care:
+            col = self.g[i + i_1][j + j_1].col
+            if col is not want and (col is not Colour.EMPTY or want is Colour.NA):
+                return i + i_1, j + j_1
+        return None
+
+    def _deduce_pattern(self, patterns: list[list[list[LogicGridCell]]]):
+        """
+        Yields (x, y, colour, reason) for each cell of the pattern that must be
+        completed, if there is only one place left a pattern could go,
+        `reason` being the cells blocking every other place
+        """
+        only = None
+        blockers = []
+        for p_height, p_width, care, _ in self._compile_patterns(patterns):
+            for i, j in self._care_windows(p_height, p_width, care):
+                blocker = self._pattern_blocker(i, j, care)
+                if blocker is not None:
+                    blockers.append(blocker)
+                elif only is not None:
+                    return
+                else:
+                    only = (i, j, care)
+        if only is None:
+            return
+        i, j, care = only
+        for i_1, j_1, want in care:
+            yield i + i_1, j + j_1, want, blockers
+
+    def _deduce_n_symbols(self, number_of_symbols: int, col: Colour, \
+                          cells: list[tuple[int, int]] = None):
+        """
+        Yields (x, y, colour, reason) for each EMPTY cell that can not be `col`,
+        because it would join regions of `col` holding too many symbols,
+        `reason` being the cells of those regions
+        If `cells` is given, only cells next to the regions they changed are looked at
+        """
+        region_of = {}
+        symbols = []
+        regions = []
+        for region in self._regions_to_check(cells, col):
+            for c in region:
+                region_of[c] = len(symbols)
+            symbols.append(sum(1 for x, y in region if self.g[x][y].inf is not None))
+            regions.append(region)
+        candidates = set()
+        for c in region_of:
+            for n in self._neighbours(*c):
+                if self.g[n[0]][n[1]].col == Colour.EMPTY:
+                    candidates.add(n)
+        for x, y in candidates:
+            joined = set()
+            for n in self._neighbours(x, y):
+                if self.g[n[0]][n[1]].col == col:
+                    if n not in region_of:
+                        region = self._region(*n)
+                        for c in region:
+                            region_of[c] = len(symbols)
+                        symbols.append(sum(1 for a, b in region if self.g[a][b].inf is not None))
+                        regions.append(region)
+                    joined.add(region_of[n])
+            total = sum(symbols[r] for r in joined)
+            if self.g[x][y].inf is not None:
+                total += 1
+            if total > number_of_symbols:
+                yield x, y, self._opposite(col), [c for r in joined for c in regions[r]]
+
+    def _deduce_linked(self, cells: list[tuple[int, int]] = None):
+        """
+        Yields (x, y, colour, reason) for each cell linked to a coloured cell,
+        `reason` being that cell
+        If `cells` is given, only the groups holding one of them are looked at
+        """
+        if cells is None:
+            groups = range(len(self.linked_cells))
+        else:
+            groups = {index for c in cells for index in self._groups_of.get(c, ())}
+        for index in groups:
+            ls = self.linked_cells[index]
+            for x, y in ls:
+                colour = self.g[x][y].col
+                if colour != Colour.EMPTY:
+                    for c in ls:
+                        yield c[0], c[1], colour, [(x, y)]
+                    break
+
+    def _deductions(self, cells: list[tuple[int, int]] = None):
+        """
+        Yields (x, y, colour, reason) for every cell a rule forces to be `colour`,
+        `reason` being the cells whose colours force it
+        If `cells` is given, only deductions they could have caused are looked for
+        """
+        yield from self._deduce_linked(cells)
+        for rule in self.rules:
+            if rule.rule_type == RuleEnum.MATCH_NOT_PATTERN:
+                yield from self._deduce_not_pattern(rule.rule_values["patterns"], cells)
+            elif rule.rule_type == RuleEnum.MATCH_PATTERN:
+                yield from self._deduce_pattern(rule.rule_values["patterns"])
+            elif rule.rule_type == RuleEnum.N_SYMBOL_PER_COLOUR:
+                yield from self._deduce_n_symbols(rule.rule_values["number"], \
+                                rule.rule_values["colour"], cells)
+
+    def _propagate(self, changed: list[tuple[int, int]] = None) -> bool:
+        """
+        Colours every cell the rules force, until nothing changes
+        Each cell coloured is put on the trail, so backtracking undoes it
+        param `changed` default None
+            the cells coloured since the last propagation, if given
+            only deductions they could have caused are looked for
+        Returns False if the rules can not be satisfied
+        (an EMPTY cell forced to be anything but WHITE or BLACK, e.g. linked
+        to an NA cell, can't be)
+        """
+        while True:
+            forced = []
+            for x, y, colour, reason in self._deductions(changed):
+                col = self.g[x][y].col
+                if col == Colour.EMPTY and colour in (Colour.WHITE, Colour.BLACK):
+                    self._assign(x, y, colour, reason)
+                    forced.append((x, y))
+                elif col != colour:
+                    self._conflict = reason + [(x, y)]
+                    return False
+            if not forced:
+                return True
+            if not self._test_rules(forced):
+                return False
+            changed = forced
+
+    def _set_linked_cell(self, index: int, colour: Colour, reason: list = None):
+        """
+        Colours every EMPTY cell of linked group `index`, recording them on the trail
+        param `reason` default None
+            the cells whose colours forced the group, None for a decision
+        Returns the cells coloured, None if one of the group is the other colour
+        """
+        changed = []
+        for x, y in self.linked_cells[index]:
+            col = self.g[x][y].col
+            if col == Colour.EMPTY:
+                self._assign(x, y, colour, reason)
+                changed.append((x, y))
+            elif col != colour:
+                self._conflict = [(x, y)]
+                return None
+        return changed
+
+    def _set_cell(self, x: int, y: int, colour: Colour):
+        """
+        Colours the EMPTY cell (x, y) and every cell linked to it,
+        so a linked group is one search variable
+        Returns the cells coloured, None if a linked cell is the other colour
+        """
+        self._assign(x, y, colour)
+        changed = [(x, y)]
+        for index in self._groups_of.get((x, y), ()):
+            coloured = self._set_linked_cell(index, colour, [(x, y)])
+            if coloured is None:
+                self._conflict.append((x, y))
+                return None
+            changed += coloured
+        return changed
+
+    def _clue_score(self, x: int, y: int) -> int:
+        """
+        Counts the cells with info in the 3x3 square around (x, y)
+        """
+        return sum(1 for i in range(max(0, x - 1), min(self.height, x + 2)) \
+                   for j in range(max(0, y - 1), min(self.width, y + 2)) \
+                   if self.g[i][j].inf is not None)
+
+    def _pattern_scores(self) -> dict:
+        """
+        Scores each EMPTY cell by how complete the most complete pattern
+        place it is in is, counting the pattern cells already matching
+        """
+        scores = {}
+        for rule in self.rules:
+            if rule.rule_type not in (RuleEnum.MATCH_PATTERN, RuleEnum.MATCH_NOT_PATTERN):
+                continue
+            for p_height, p_width, care, _ in self._compile_patterns(rule.rule_values["patterns"]):
+                for i, j in self._care_windows(p_height, p_width, care):
+                    matched = 0
+                    empty = []
+                    for i_1, j_1, want in care:
+                        col = self.g[i + i_1][j + j_1].col
+                        if col is want:
+                            matched += 1
+                        elif col is Colour.EMPTY:
+                            empty.append((i + i_1, j + j_1))
+                        else:
+                            break
+                    else:
+                        for c in empty:
+                            scores[c] = max(scores.get(c, 0), matched)
+        return scores
+
+    def _cut_cells(self, colour: Colour) -> set[tuple[int, int]]:
+        """
+        Finds the cells whose loss would split the cells `colour` can pass
+        through (its articulation points), with an iterative Tarjan search
+        """
+        def passable(c):
+            return self.g[c[0]][c[1]].col in (colour, Colour.EMPTY)
+
+        disc = {}
+        low = {}
+        cut = set()
+        for root in ((i, j) for i in range(self.height) for j in range(self.width)):
+            if root in disc or not passable(root):
+                continue
+            disc[root] = low[root] = len(disc)
+            children = 0
+            stack = [(root, None, self._neighbours(*root))]
+            while stack:
+                v, parent, neighbours = stack[-1]
+                for n in neighbours:
+                    if n == parent or not passable(n):
+                        continue
+                    if n in disc:
+                        low[v] = min(low[v], disc[n])
+                    else:
+                        disc[n] = low[n] = len(disc)
+                        stack.append((n, v, self._neighbours(*n)))
+                        break
+                else:
+                    stack.pop()
+                    if parent == root:
+                        children += 1
+                    elif parent is not None:
+                        low[parent] = min(low[parent], low[v])
+                        if low[v] >= disc[parent]:
+                            cut.add(parent)
+            if children > 1:
+                cut.add(root)
+        return cut
+
+    def _failed_colours(self, x: int, y: int) -> int:
+        """
+        Counts the colours the EMPTY cell (x, y) can't be without breaking a rule
+        """
+        failed = 0
+        mark = len(self._trail)
+        for colour in (Colour.WHITE, Colour.BLACK):
+            changed = self._set_cell(x, y, colour)
+            if changed is None or not self._test_rules(changed):
+                failed += 1
+            self._undo(mark)
+        return failed
+
+    def _next_cell(self, start: int = 0):
+        """
+        Picks the EMPTY cell to branch on next, None if there are none left
+        Without a `cell_order`, the first EMPTY cell in row major order from
+        flat index `start` (all cells before it are coloured)
+        Otherwise the best by the `cell_order` heuristics, each breaking ties
+        of the ones before it, and cells that tie on all stay in row major order
+        """
+        if not self.cell_order:
+            for k in range(start, self.height * self.width):
+                x, y = divmod(k, self.width)
+                if self.g[x][y].col == Colour.EMPTY:
+                    return x, y
+            return None
+        cells = [(i, j) for i in range(self.height) for j in range(self.width) \
+                 if self.g[i][j].col == Colour.EMPTY]
+        if not cells:
+            return None
+        scorers = []
+        for order in self.cell_order:
+            if order == "clues":
+                scorers.append(lambda c: self._clue_score(*c))
+            elif order == "patterns":
+                scorers.append(self._pattern_scores().get)
+            elif order == "bottleneck":
+                cut = set()
+                for rule in self.rules:
+                    if rule.rule_type == RuleEnum.CONNECT_CELLS:
+                        cut |= self._cut_cells(rule.rule_values["colour"])
+                scorers.append(cut.__contains__)
+            else:
+                scorers.append(lambda c: self._failed_colours(*c))
+        return max(cells, key=lambda c: tuple(scorer(c) or 0 for scorer in scorers))
+
+    def _explain_failure(self, rule: Rule, cells: list[tuple[int, int]] = None):
+        """
+        Finds cells whose colours alone break `rule`, whatever the other
+        cells become
+        If `cells` is given, the rule was broken by colouring them
+        Returns None if the rule can't be explained like this
+        """
+        if rule.rule_type == RuleEnum.MATCH_NOT_PATTERN:
+            for p_height, p_width, care, _ in self._compile_patterns(rule.rule_values["patterns"]):
+                for i, j in self._care_windows(p_height, p_width, care, cells):
+                    if all(self.g[i + i_1][j + j_1].col is want for i_1, j_1, want in care):
+                        return [(i + i_1, j + j_1) for i_1, j_1, _ in care]
+        elif rule.rule_type == RuleEnum.MATCH_PATTERN:
+            blockers = []
+            for p_height, p_width, care, _ in self._compile_patterns(rule.rule_values["patterns"]):
+                for i, j in self._care_windows(p_height, p_width, care):
+                    blocker = self._pattern_blocker(i, j, care)
+                    if blocker is None:
+                        return None
+                    blockers.append(blocker)
+            return blockers
+        elif rule.rule_type == RuleEnum.CONNECT_CELLS:
+            # Two cells of the colour, one walled off by the cells around it,
+            # using whichever of the two has the shorter wall
+            colour = rule.rule_values["colour"]
+            same = [(i, j) for i in range(self.height) for j in range(self.width) \
+                    if self.g[i][j].col is colour]
+            if not same:
+                return None
+            reach, walls = self._walled_area(same[0], colour)
+            apart = [c for c in same if c not in reach]
+            if not apart:
+                return None
+            other_walls = self._walled_area(apart[0], colour)[1]
+            return [same[0], apart[0]] + list(min(walls, other_walls, key=len))
+        elif rule.rule_type == RuleEnum.N_SYMBOL_PER_COLOUR:
+            for region in self._regions_to_check(cells, rule.rule_values["colour"]):
+                symbols = sum(1 for x, y in region if self.g[x][y].inf is not None)
+                if symbols > rule.rule_values["number"]:
+                    return list(region)
+        elif rule.rule_type in (RuleEnum.AREA_NUMBER, RuleEnum.AREA_NUMBERS_ARE_ONE_OFF):
+            one_off = rule.rule_type != RuleEnum.AREA_NUMBER
+            for colour, region, _, numbers, _ in self._label_regions(cells)[1]:
+                for num in numbers:
+                    sizes = (num - 1, num + 1) if one_off else (num,)
+                    anchor = next(c for c in region if self._info(*c, "number") == num)
+                    wrong = self._wrong_size(colour, region, sizes, True, anchor)
+                    if wrong is not None:
+                        return wrong
+        elif rule.rule_type == RuleEnum.N_CELLS_PER_REGION:
+            for colour, region, _, _, _ in self._label_regions(cells)[1]:
+                if colour == rule.rule_values["colour"]:
+                    wrong = self._wrong_size(colour, region, (rule.rule_values["number"],), True)
+                    if wrong is not None:
+                        return wrong
+        elif rule.rule_type == RuleEnum.LETTER_SORTED:
+            return self._letter_conflict(cells)
+        return None
+
+    def _walled_area(self, start: tuple[int, int], colour: Colour):
+        """
+        Gets the cells `colour` can reach from `start` (through cells of
+        that colour or EMPTY), and the cells walling them in
+        """
+        reach = {start}
+        walls = set()
+        stack = [start]
+        while stack:
+            for n in self._neighbours(*stack.pop()):
+                if n in reach or n in walls:
+                    continue
+                if self.g[n[0]][n[1]].col in (colour, Colour.EMPTY):
+                    reach.add(n)
+                    stack.append(n)
+                else:
+                    walls.add(n)
+        return reach, walls
 
-    def _solve(self, _cell_x = 0, _cell_y = 0, depth = 0) -> bool:
+    def _decisions_behind(self, cells: list[tuple[int, int]]):
+        """
+        Follows the reasons of forced cells back to the decisions behind `cells`
+        Returns the set of decision cells, None if `cells` is None
+        """
+        if cells is None:
+            return None
+        decisions = set()
+        seen = set()
+        stack = list(cells)
+        while stack:
+            c = stack.pop()
+            if c in seen or c not in self._reasons:
+                continue
+            seen.add(c)
+            reason = self._reasons[c]
+            if reason is None:
+                decisions.add(c)
+            else:
+                stack.extend(reason)
+        return decisions
+
+    def _learn_nogood(self, decisions: set[tuple[int, int]]) -> None:
+        """
+        Remembers that the current colours of `decisions` can't be part of a solution
+        Each nogood is watched by one cell not yet its colour, it is only
+        looked at when that cell is coloured, starting with the latest decision
+        """
+        if not decisions:
+            return
+        nogood = [(x, y, self.g[x][y].col) for x, y in decisions]
+        order = {c: k for k, c in enumerate(self._trail)}
+        x, y, colour = max(nogood, key=lambda literal: order[literal[:2]])
+        self._nogoods.setdefault((x, y, colour.value), []).append(nogood)
+
+    def _nogood_hit(self, mark: int) -> bool:
+        """
+        Checks if the cells coloured since the trail was `mark` long complete a nogood
+        """
+        for x, y in self._trail[mark:]:
+            key = (x, y, self.g[x][y].col.value)
+            watching = self._nogoods.pop(key, None)
+            if watching is None:
+                continue
+            for k, nogood in enumerate(watching):
+                for a, b, colour in nogood:
+                    if self.g[a][b].col is not colour:
+                        self._nogoods.setdefault((a, b, colour.value), []).append(nogood)
+                        break
+                else:
+                    self._nogoods[key] = watching[k:]
+                    self._conflict = [(a, b) for a, b, _ in nogood]
+                    return True
+        return False
+
+    def _solve(self) -> bool:
         """
         Provides a solution to the puzzle
         If returns True, all checks passed
         If returns False, invalid solution
         """
-        self.attempts += 1
-        if depth == 42:
-            print(dt.now())
-        # This is the final cell, and we need to check all rules are satisfied
-        if _cell_x == self.height - 1 and _cell_y == self.width - 1:
-            colours_to_test = [self.g[_cell_x][_cell_y].col]
-            if self.g[_cell_x][_cell_y].col == Colour.EMPTY:
-                colours_to_test = [Colour.WHITE,Colour.BLACK]
-            for colour in colours_to_test:
-                self.g[_cell_x][_cell_y].col = colour
-                if self._test_rules():
-                    return True
+        self._nogoods.clear()
+        self._branches = []
+        return self._search() is True
+
+    def _search(self, start: int = 0, base: int = None):
+        """
+        Branches on the cell picked by `_next_cell`, trying white then black
+        When both fail, the failure is traced back to the decisions that
+        caused it, so the search jumps straight back over decisions that
+        played no part, and the ones that did are learnt as a nogood
+        The search is a loop over an explicit stack, `_branches`, with a
+        frame [x, y, colour, given away, trail mark, failures] per decision,
+        so its depth is not bound by the recursion limit
+        Returns True if solved, otherwise the decision cells behind the
+        failure, None if it can't be explained
+        param `base` default None
+            once solved the frames are left on the stack, calling again with
+            `base` the length the stack had at the first call carries on
+            the search to the next solution
+        """
+        stack = self._branches
+        resume = base is not None
+        if not resume:
+            base = len(stack)
+        while True:
+            if resume:
+                # A solution is not a failure, so nothing can be learnt from it
+                resume = False
+                result = None
+            else:
+                self.attempts += 1
+                if self.attempts % self.STEAL_INTERVAL == 0:
+                    if self._cancelled is not None and self._cancelled():
+                        raise SearchCancelled()
+                    if self._steal is not None:
+                        self._offer_branches()
+                cell = self._next_cell(start)
+                # No EMPTY cells left, and we need to check all rules are satisfied
+                if cell is None:
+                    if self._test_rules():
+                        return True
+                    result = self._decisions_behind(self._explain_failure(*self._broken))
+                else:
+                    stack.append([cell[0], cell[1], None, False, len(self._trail), []])
+
+            # Try the next colour of the frame on top, `result` being how
+            # the last one failed, until one passes the rules and is searched
+            while len(stack) > base:
+                frame = stack[-1]
+                x, y, colour, given, mark, conflicts = frame
+                if colour is not None:
+                    self._undo(mark)
+                    if result is not None and (x, y) not in result:
+                        # This cell played no part, the other colour fails the same way
+                        stack.pop()
+                        continue
+                    conflicts.append(result)
+                    if given:
+                        # The other colour was given away, so this failure can't be explained
+                        stack.pop()
+                        result = None
+                        continue
+                    if colour == Colour.BLACK:
+                        stack.pop()
+                        if None in conflicts:
+                            result = None
+                        else:
+                            result = (conflicts[0] | conflicts[1]) - {(x, y)}
+                            self._learn_nogood(result)
+                        continue
+                # the cell's linked group is coloured with it,
+                # any other forced cells are coloured by _propagate
+                frame[2] = Colour.WHITE if colour is None else Colour.BLACK
+                self._conflict = None
+                changed = self._set_cell(x, y, frame[2])
+                if changed is not None and self._test_rules(changed) and \
+                   self._propagate(changed) and not self._nogood_hit(mark):
+                    start = x * self.width + y
+                    break
+                if self._conflict is not None:
+                    result = self._decisions_behind(self._conflict)
+                else:
+                    result = self._decisions_behind(self._explain_failure(*self._broken))
+            else:
+                return result
+
+    def solutions(self):
+        """
+        Yields every solution as it is found, each a 2d list of the colours of the cells
+        The search prunes as `solution` does, carrying on from each solution
+        to the next instead of starting again
+        The grid must not be changed while the generator is suspended,
+        it is put back as it was once the generator finishes or is closed
+        """
+        if self.backend == "bitboard":
+            self._load_bits()
+        mark = len(self._trail)
+        try:
+            if not (self._test_rules() and self._propagate()):
+                return
+            self._nogoods.clear()
+            self._branches = []
+            found = self._search()
+            while found is True:
+                yield [[cell.col for cell in row] for row in self.g]
+                found = self._search(base=0)
+        finally:
+            self._undo(mark)
+
+    def count_solutions(self, limit: int | None = None) -> int:
+        """
+        Counts the solutions to the puzzle
+        param `limit` default None
+            if given, stops counting once `limit` solutions are found,
+            a limit of 2 is enough to tell if the solution is unique
+        """
+        if limit is not None and limit <= 0:
+            return 0
+        count = 0
+        solutions = self.solutions()
+        try:
+            for _ in solutions:
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+        finally:
+            solutions.close()
+        return count
+
+    def _rule_key(self, rule: Rule, turn: int) -> str:
+        """
+        Gets a description of `rule` for `_fingerprint`, with its patterns
+        turned the way `Rule.symmetries` turns a 2d array at index `turn`
+        """
+        def turned(p):
+            if not p:
+                return p
+            return [[c.col.value for c in row] for row in Rule.symmetries(p)[turn]]
+
+        values = {}
+        for key, value in rule.rule_values.items():
+            if key in ("pattern", "patterns"):
+                # `patterns` is what gets matched when set, in any order
+                patterns = rule.rule_values.get("patterns")
+                if patterns is None:
+                    value = turned(rule.rule_values.get("pattern"))
+                else:
+                    value = sorted(turned(p) for p in patterns)
+            elif isinstance(value, Colour):
+                value = value.value
+            values[key] = value
+        return json.dumps([rule.rule_type.value, values], sort_keys=True, default=str)
+
+    def _fingerprint(self):
+        """
+        Gets a key for the puzzle (colours, cell info, rules and linked cells)
+        for the solution cache, the same for its rotations and reflections
+        The grid is turned each of the 8 ways, the rules' patterns with it,
+        and the turn with the smallest encoding is used
+        Returns (key, cells), `cells` being the cells of this grid in the
+        order of the turned grid, row by row
+        """
+        coords = [[(i, j) for j in range(self.width)] for i in range(self.height)]
+        best = None
+        for turn, variant in enumerate(Rule.symmetries(coords)):
+            cells = [c for row in variant for c in row]
+            where = {c: k for k, c in enumerate(cells)}
+            grid = [[[self.g[i][j].col.value, self.g[i][j].inf] for i, j in row] for row in variant]
+            linked = sorted(sorted(where[tuple(c)] for c in group) for group in self.linked_cells)
+            rules = sorted(self._rule_key(rule, turn) for rule in self.rules)
+            text = json.dumps(["LogicGrid", grid, linked, rules], sort_keys=True, default=str)
+            if best is None or text < best[0]:
+                best = (text, cells)
+        return hashlib.sha256(best[0].encode()).hexdigest(), best[1]
+
+    def _load_solution(self, colours, cells: list[tuple[int, int]]):
+        """
+        Colours the EMPTY cells from a solution in the cache, `colours` being
+        the colour values of `cells`
+        Returns True if coloured, False if the puzzle is cached as having no
+        solution, None if `colours` is False (it isn't cached) or the
+        solution doesn't fit the puzzle, which is left as it was
+        """
+        if colours is False:
+            return None
+        if colours is None:
             return False
+        mark = len(self._trail)
+        for (x, y), value in zip(cells, colours):
+            if self.g[x][y].col == Colour.EMPTY:
+                self._assign(x, y, Colour(value))
+        if self.num_empty() == 0 and self._test_rules() and \
+           all(len({self.g[x][y].col.value for x, y in group}) == 1 for group in self.linked_cells):
+            return True
+        self._undo(mark)
+        return None
 
-        # Advance to next cell
-        if _cell_y == self.width - 1: # If last cell in row
-            new_cell_y = 0
-            new_cell_x = _cell_x + 1
-        else:
-            new_cell_y = _cell_y + 1
-            new_cell_x = _cell_x
-
-        # if gray, try black and then white
-        if self.g[_cell_x][_cell_y].col == Colour.EMPTY:
-            cells = []
-            for ls in self.linked_cells:
-                if ls[0] == (_cell_x,_cell_y):
-                    cells = ls[1:]
-            for colour in (Colour.WHITE,Colour.BLACK):
-                self.g[_cell_x][_cell_y].col = colour
-                if len(cells) > 0:
-                    for c in cells:
-                        self.g[c[0]][c[1]].col = colour
-                if not self._test_rules():
+    def _offer_branches(self) -> None:
+        """
+        Gives away the untried black branches of the search, shallowest
+        (so largest) first, for as long as `_steal` takes them
+        `_steal` is called with the decisions leading to the branch,
+        a list of (x, y, colour)
+        """
+        decisions = []
+        for branch in self._branches:
+            x, y, colour, given = branch[:4]
+            if colour == Colour.WHITE and not given:
+                if not self._steal(decisions + [(x, y, Colour.BLACK)]):
+                    return
+                branch[3] = True
+            decisions.append((x, y, colour))
+
+    def _replay(self, decisions: list) -> bool:
+        """
+        Colours the cells of `decisions`, a list of (x, y, colour), as search
+        decisions, propagating after each
+        They are kept on `_branches` as already given away, so the
+        branches offered later start with them
+        Returns False if they break the rules
+        """
+        self._branches = [[x, y, colour, True, None, None] for x, y, colour in decisions]
+        for x, y, colour in decisions:
+            col = self.g[x][y].col
+            if col == colour:
+                continue
+            if col != Colour.EMPTY:
+                return False
+            changed = self._set_cell(x, y, colour)
+            if changed is None or not self._test_rules(changed) or \
+               not self._propagate(changed):
+                return False
+        return True
+
+    def _solve_parallel(self, workers: int) -> bool:
+        """
+        Provides a solution to the puzzle, searching with `workers` processes
+        Each process keeps one LogicGrid and is handed subtrees as the
+        decisions leading to them, the first being the whole tree
+        While a process is idle the busy ones give it their untried
+        branches, so the work spreads out without splitting it up front
+        The first solution found stops every process
+        """
+        ctx = multiprocessing.get_context()
+        stop = ctx.Event()
+        idle = ctx.Value('i', workers - 1)
+        given = ctx.Queue()
+        options = {
+            "backend": self.backend,
+            "cell_order": self.cell_order
+        }
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_logic_grid_worker, \
+                initargs=(self.g, self.rules, self.linked_cells, options, stop, idle, given)) as pool:
+            running = {pool.submit(_logic_grid_subtree, [])}
+            expected = received = 0
+            while running or received < expected:
+                done, running = wait(running, timeout=0.01, return_when=FIRST_COMPLETED)
+                for future in done:
+                    colours, count, attempts = future.result()
+                    self.attempts += attempts
+                    expected += count
+                    if colours is not None:
+                        stop.set()
+                        pool.shutdown(cancel_futures=True)
+                        for x, row in enumerate(colours):
+                            for y, colour in enumerate(row):
+                                if self.g[x][y].col == Colour.EMPTY:
+                                    self._assign(x, y, colour)
+                        return True
+                    with idle.get_lock():
+                        idle.value += 1
+                while True:
+                    try:
+                        # Wait for a branch still on its way if nothing is running
+                        decisions = given.get(not running, 0.01)
+                    except queue.Empty:
+                        break
+                    received += 1
+                    running.add(pool.submit(_logic_grid_subtree, decisions))
+        return False
+
+    def _sat_lit(self, var: dict, x: int, y: int, colour: Colour) -> int:
+        """
+        Gets the literal for cell (x, y) being `colour`
+        """
+        v = var[(x, y)]
+        return v if colour == Colour.WHITE else -v
+
+    def _sat_same_colour(self, solver: SatSolver, var: dict, cells: list[tuple[int, int]]):
+        """
+        Adds clauses making all of `cells` the same colour
+        """
+        cells = [c for c in cells if c in var]
+        for a, b in zip(cells, cells[1:]):
+            solver.add_clause([-var[a], var[b]])
+            solver.add_clause([var[a], -var[b]])
+
+    def _sat_window(self, var: dict, p: list[list[LogicGridCell]], i: int, j: int):
+        """
+        Gets the literals that must all be true for pattern `p` to match
+        with its top left corner at (i, j), None if it can never match there
+        """
+        lits = []
+        for i_1 in range(len(p)):
+            for j_1 in range(len(p[0])):
+                want = p[i_1][j_1].col
+                if want == Colour.EMPTY:
+                    continue
+                cell = (i + i_1, j + j_1)
+                if cell not in var:
+                    if want == Colour.NA:
+                        continue
+                    return None
+                if want == Colour.NA:
+                    return None
+                lits.append(self._sat_lit(var, *cell, want))
+        return lits
+
+    def _sat_encode(self, solver: SatSolver) -> dict:
+        """
+        Creates a variable for each cell that is not NA, true meaning WHITE,
+        and adds clauses for the given colours, linked cells, patterns
+        and cells sharing a letter (which must be the same colour)
+        Returns the variable of each cell
+        """
+        var = {}
+        for i in range(self.height):
+            for j in range(self.width):
+                col = self.g[i][j].col
+                if col == Colour.NA:
+                    continue
+                var[(i, j)] = solver.new_var()
+                if col != Colour.EMPTY:
+                    solver.add_clause([self._sat_lit(var, i, j, col)])
+        for ls in self.linked_cells:
+            if any(c not in var for c in ls) and any(c in var for c in ls):
+                solver.add_clause([])
+            self._sat_same_colour(solver, var, ls)
+        for rule in self.rules:
+            if rule.rule_type == RuleEnum.MATCH_NOT_PATTERN:
+                for p in rule.rule_values["patterns"]:
+                    for i, j in self._pattern_windows(p):
+                        lits = self._sat_window(var, p, i, j)
+                        if lits is not None:
+                            solver.add_clause([-l for l in lits])
+            elif rule.rule_type == RuleEnum.MATCH_PATTERN:
+                found = []
+                for p in rule.rule_values["patterns"]:
+                    for i, j in self._pattern_windows(p):
+                        lits = self._sat_window(var, p, i, j)
+                        if lits is None:
+                            continue
+                        a = solver.new_var()
+                        for l in lits:
+                            solver.add_clause([-a, l])
+                        found.append(a)
+                solver.add_clause(found)
+            elif rule.rule_type == RuleEnum.LETTER_SORTED:
+                letters = {}
+                for x, y in var:
+                    letter = self._info(x, y, "letter")
+                    if letter is not None:
+                        letters.setdefault(letter, []).append((x, y))
+                for same in letters.values():
+                    self._sat_same_colour(solver, var, same)
+        return var
+
+    def _sat_border(self, var: dict, region: set[tuple[int, int]]) -> set[tuple[int, int]]:
+        """
+        Gets the cells next to `region` that could join it (are not NA)
+        """
+        return {n for c in region for n in self._neighbours(*c) \
+                if n not in region and n in var}
+
+    def _sat_closed(self, var: dict, region: set[tuple[int, int]], colour: Colour) -> list[int]:
+        """
+        Clause ruling out `region` being exactly a region of `colour`,
+        i.e. all of it `colour` and none of the cells around it
+        """
+        return [-self._sat_lit(var, *c, colour) for c in region] + \
+               [self._sat_lit(var, *b, colour) for b in self._sat_border(var, region)]
+
+    def _sat_bfs(self, region: set[tuple[int, int]], start: tuple[int, int]) -> dict:
+        """
+        Breadth first search of `region` from `start`
+        Returns the parent of each cell, in the order they were reached
+        """
+        parents = {start: None}
+        queue = [start]
+        for c in queue:
+            for n in self._neighbours(*c):
+                if n in region and n not in parents:
+                    parents[n] = c
+                    queue.append(n)
+        return parents
+
+    def _sat_path(self, parents: dict, cell: tuple[int, int]) -> list[tuple[int, int]]:
+        """
+        Gets the cells from `cell` back to the start of a `_sat_bfs`
+        """
+        path = []
+        while cell is not None:
+            path.append(cell)
+            cell = parents[cell]
+        return path
+
+    def _sat_size_cut(self, var: dict, region: set[tuple[int, int]], start: tuple[int, int], \
+                      allowed: tuple[int]):
+        """
+        Clause ruling out the size of `region` if it is not in `allowed`, None if it is
+        Too big regions only need `max(allowed) + 1` connected cells of theirs
+        ruled out, too small ones the exact region
+        """
+        if len(region) in allowed:
+            return None
+        colour = self.g[start[0]][start[1]].col
+        if len(region) > max(allowed):
+            cells = list(self._sat_bfs(region, start))[:max(allowed) + 1]
+            return [-self._sat_lit(var, *c, colour) for c in cells]
+        return self._sat_closed(var, region, colour)
+
+    def _region_colour(self, region: set[tuple[int, int]]) -> Colour:
+        """
+        Gets the colour of a region
+        """
+        x, y = next(iter(region))
+        return self.g[x][y].col
+
+    def _sat_cuts(self, var: dict) -> list[list[int]]:
+        """
+        Finds clauses ruling out the ways the fully coloured grid breaks the
+        connectivity and region rules
+        Each clause only rules out colourings that break a rule the same way
+        """
+        cuts = []
+        regions = [r for r in self._regions_to_check() if next(iter(r)) in var]
+        for rule in self.rules:
+            if rule.rule_type == RuleEnum.CONNECT_CELLS:
+                # Two cells of the colour can only meet through the cells around either's region
+                colour = rule.rule_values["colour"]
+                same = [r for r in regions if self._region_colour(r) == colour]
+                if len(same) < 2:
                     continue
-                if self._solve(new_cell_x, new_cell_y, depth + 1): # If a solution is found
+                for region in same:
+                    s = next(iter(region))
+                    border = [self._sat_lit(var, *b, colour) for b in self._sat_border(var, region)]
+                    for other in same:
+                        if other is not region:
+                            t = next(iter(other))
+                            cuts.append([-self._sat_lit(var, *s, colour), \
+                                         -self._sat_lit(var, *t, colour)] + border)
+            elif rule.rule_type in [RuleEnum.AREA_NUMBER, RuleEnum.AREA_NUMBERS_ARE_ONE_OFF]:
+                for region in regions:
+                    for x, y in region:
+                        num = self._info(x, y, "number")
+                        if num is None:
+                            continue
+                        if rule.rule_type == RuleEnum.AREA_NUMBER:
+                            allowed = (num,)
+                        else:
+                            allowed = (num - 1, num + 1)
+                        cut = self._sat_size_cut(var, region, (x, y), allowed)
+                        if cut is not None:
+                            cuts.append(cut)
+            elif rule.rule_type == RuleEnum.N_CELLS_PER_REGION:
+                colour = rule.rule_values["colour"]
+                for region in regions:
+                    if self._region_colour(region) == colour:
+                        cut = self._sat_size_cut(var, region, next(iter(region)), \
+                                                 (rule.rule_values["number"],))
+                        if cut is not None:
+                            cuts.append(cut)
+            elif rule.rule_type == RuleEnum.N_SYMBOL_PER_COLOUR:
+                # Rule out a connected part of the region holding one symbol too many
+                number = rule.rule_values["number"]
+                colour = rule.rule_values["colour"]
+                for region in regions:
+                    if self._region_colour(region) != colour:
+                        continue
+                    symbols = [(x, y) for x, y in region if self.g[x][y].inf is not None]
+                    if len(symbols) <= number:
+                        continue
+                    parents = self._sat_bfs(region, symbols[0])
+                    cells = set()
+                    for c in [c for c in parents if c in symbols][:number + 1]:
+                        cells.update(self._sat_path(parents, c))
+                    cuts.append([-self._sat_lit(var, *c, colour) for c in cells])
+            elif rule.rule_type == RuleEnum.LETTER_SORTED:
+                for region in regions:
+                    letters = {c: self._info(*c, "letter") for c in region}
+                    letters = {c: l for c, l in letters.items() if l is not None}
+                    if not letters:
+                        continue
+                    a, letter = next(iter(letters.items()))
+                    colour = self.g[a[0]][a[1]].col
+                    parents = self._sat_bfs(region, a)
+                    other = [c for c in parents if c in letters and letters[c] != letter]
+                    if other:
+                        # A path joins two different letters
+                        cuts.append([-self._sat_lit(var, *c, colour) \
+                                     for c in self._sat_path(parents, other[0])])
+                        continue
+                    apart = [(i, j) for i in range(self.height) for j in range(self.width) \
+                             if (i, j) in var and (i, j) not in region \
+                             and self._info(i, j, "letter") == letter]
+                    if apart:
+                        # The same letter is cut off by the cells around the region
+                        cuts.append([-self._sat_lit(var, *a, colour), \
+                                     -self._sat_lit(var, *apart[0], colour)] + \
+                            [self._sat_lit(var, *b, colour) for b in self._sat_border(var, region)])
+        return cuts
+
+    def _solve_sat(self) -> bool:
+        """
+        Provides a solution to the puzzle using the SAT backend
+        The colours, linked cells and patterns are encoded as clauses up front,
+        the connectivity and region rules are added lazily as cuts whenever
+        the solution found breaks them, and the solver is run again
+        """
+        solver = SatSolver()
+        var = self._sat_encode(solver)
+        while solver.solve():
+            self.attempts += 1
+            mark = len(self._trail)
+            for (x, y), v in var.items():
+                if self.g[x][y].col == Colour.EMPTY:
+                    self._assign(x, y, Colour.WHITE if solver.value(v) else Colour.BLACK)
+            cuts = self._sat_cuts(var)
+            if not cuts:
+                # Regions of NA cells can't be cut, they never change
+                if self._test_rules():
                     return True
-            self.g[_cell_x][_cell_y].col = Colour.EMPTY
-        else:
-            if self._solve(new_cell_x, new_cell_y, depth): # If a solution is found
-                return True
+                self._undo(mark)
+                return False
+            self._undo(mark)
+            for clause in cuts:
+                solver.add_clause(clause)
         return False
 
-    def solution(self) -> None:
+    def solution(self, engine: str = "search", workers: int = 1) -> None:
         """
         Provides a solution to the puzzle
         Prints to console
+        param `engine` default "search"
+            "search" uses the backtracking search,
+            "sat" compiles the puzzle to clauses for the bundled SAT solver
+        param `workers` default 1
+            if more than 1, the backtracking search is shared between that many processes
         """
-        if self._solve():
+        if engine not in ("search", "sat"):
+            raise ValueError(f"Unknown engine {engine}")
+        if self.backend == "bitboard":
+            self._load_bits()
+        found = None
+        if self.cache is not None:
+            key, cells = self._fingerprint()
+            found = self._load_solution(self.cache.get(key, False), cells)
+        if found is None:
+            if engine == "sat":
+                found = self._solve_sat()
+            elif workers > 1:
+                found = self._test_rules() and self._propagate() and self._solve_parallel(workers)
+            else:
+                found = self._test_rules() and self._propagate() and self._solve()
+            if self.cache is not None:
+                self.cache.store(key, [self.g[x][y].col.value for x, y in cells] if found else None)
+        if found:
             print("Valid Solution Found:")
             print(repr(self))
         else:
             #print(self.attempts)
             print("No valid solution found :(")
 
+_logic_grid_worker = None
+
+def _init_logic_grid_worker(grid, rules, linked_cells, options, stop, idle, given):
+    """
+    Sets up a process of a parallel LogicGrid search
+    Each process keeps one LogicGrid (and the nogoods it learns) for all its subtrees
+    `options` are the keyword arguments to create it with
+    """
+    global _logic_grid_worker
+    lg = LogicGrid(grid, rules, linked_cells, **options)
+    lg._cancelled = stop.is_set
+    _logic_grid_worker = (lg, idle, given)
+
+def _logic_grid_subtree(decisions: list):
+    """
+    Searches the subtree after `decisions`, a list of (x, y, colour),
+    giving away branches to idle processes along the way
+    Returns (colours, branches given away, attempts), colours being
+    the solved grid's colours, None if there is no solution or it was cancelled
+    """
+    lg, idle, given = _logic_grid_worker
+    count = 0
+    def steal(branch):
+        nonlocal count
+        with idle.get_lock():
+            if idle.value <= 0:
+                return False
+            idle.value -= 1
+        given.put(branch)
+        count += 1
+        return True
+    lg._steal = steal
+    attempts = lg.attempts
+    try:
+        if lg._replay(decisions) and lg._search() is True:
+            return [[c.col for c in row] for row in lg.g], count, lg.attempts - attempts
+        return None, count, lg.attempts - attempts
+    except SearchCancelled:
+        return None, count, lg.attempts - attempts
+    finally:
+        lg._undo(0)
+
 def interpret_lg(grid: list[str]) -> LogicGrid:
     """
     Creates a logic grid from a given grid
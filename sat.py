@@ -0,0 +1,294 @@
+"""
+A small conflict driven clause learning (CDCL) SAT solver
+Used by the LogicGrid SAT backend, so no external solver is needed
+"""
+import heapq
+
+class SatSolver():
+    """
+    Solves boolean formulas in conjunctive normal form
+
+    Variables are numbered from 1, a literal is a variable (true)
+    or its negation (false), a clause is a list of literals
+
+    func `new_var` creates a variable
+    func `add_clause` adds a clause, also between calls to `solve`
+    func `solve` returns True if every clause can be satisfied
+    func `value` gets the value of a variable in the last solution found
+
+    Uses two watched literals, first UIP clause learning with
+    non-chronological backjumping, VSIDS branching with phase saving
+    and Luby restarts
+    Learnt clauses are kept between calls to `solve`
+    """
+    RESTART_BASE = 100
+    ACTIVITY_DECAY = 0.95
+
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []
+        self.watches = {}
+        self.assign = [None]
+        self.level = [0]
+        self.reason = [None]
+        self.activity = [0.0]
+        self.phase = [False]
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.heap = []
+        self.bump = 1.0
+        self.model = None
+        self.unsat = False
+        self.conflicts = 0
+
+    def new_var(self) -> int:
+        """
+        Creates a new variable
+        """
+        self.num_vars += 1
+        v = self.num_vars
+        self.assign.append(None)
+        self.level.append(0)
+        self.reason.append(None)
+        self.activity.append(0.0)
+        self.phase.append(False)
+        self.watches[v] = []
+        self.watches[-v] = []
+        heapq.heappush(self.heap, (0.0, v))
+        return v
+
+    def value(self, var: int) -> bool:
+        """
+        Gets the value of `var` in the last solution found
+        """
+        return self.model[var]
+
+    def _lit_value(self, lit: int):
+        """
+        True or False if `lit` is assigned, None otherwise
+        """
+        val = self.assign[abs(lit)]
+        if val is None:
+            return None
+        return val if lit > 0 else not val
+
+    def add_clause(self, lits: list[int]) -> None:
+        """
+        Adds a clause, the solver must not be in the middle of `solve`
+        """
+        if self.unsat:
+            return
+        self._backtrack(0)
+        clause = []
+        for lit in lits:
+            val = self._lit_value(lit)
+            if val is True or -lit in clause:
+                return # Already satisfied
+            if val is None and lit not in clause:
+                clause.append(lit)
+        if not clause:
+            self.unsat = True
+        elif len(clause) == 1:
+            self._enqueue(clause[0], None)
+            if self._propagate() is not None:
+                self.unsat = True
+        else:
+            self._attach(clause)
+
+    def _attach(self, clause: list[int]) -> int:
+        """
+        Stores a clause, watching its first two literals
+        """
+        self.clauses.append(clause)
+        index = len(self.clauses) - 1
+        self.watches[clause[0]].append(index)
+        self.watches[clause[1]].append(index)
+        return index
+
+    def _decision_level(self) -> int:
+        return len(self.trail_lim)
+
+    def _enqueue(self, lit: int, reason) -> None:
+        """
+        Makes `lit` true at the current decision level
+        """
+        var = abs(lit)
+        self.assign[var] = lit > 0
+        self.level[var] = self._decision_level()
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def _propagate(self):
+        """
+        Does unit propagation of every literal not yet propagated
+        Returns the index of a conflicting clause, or None
+        """
+        while self.qhead < len(self.trail):
+            false_lit = -self.trail[self.qhead]
+            self.qhead += 1
+            watchers = self.watches[false_lit]
+            self.watches[false_lit] = []
+            for k, index in enumerate(watchers):
+                clause = self.clauses[index]
+                # Keep the literal that became false second
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], clause[0]
+                first = clause[0]
+                if self._lit_value(first) is True:
+                    self.watches[false_lit].append(index)
+                    continue
+                # Look for another literal to watch
+                for m in range(2, len(clause)):
+                    if self._lit_value(clause[m]) is not False:
+                        clause[1], clause[m] = clause[m], clause[1]
+                        self.watches[clause[1]].append(index)
+                        break
+                else:
+                    self.watches[false_lit].append(index)
+                    if self._lit_value(first) is False:
+                        self.watches[false_lit].extend(watchers[k + 1:])
+                        self.qhead = len(self.trail)
+                        return index
+                    self._enqueue(first, index)
+        return None
+
+    def _analyze(self, conflict: int):
+        """
+        Finds the first UIP clause of a conflict
+        Returns (learnt clause, level to backjump to)
+        The asserting literal is first, and a literal of the backjump
+        level second so it can be watched
+        """
+        seen = set()
+        learnt = [None]
+        counter = 0
+        lit = None
+        index = len(self.trail) - 1
+        clause = self.clauses[conflict]
+        while True:
+            for q in (clause if lit is None else clause[1:]):
+                var = abs(q)
+                if var in seen or self.level[var] == 0:
+                    continue
+                seen.add(var)
+                self._bump(var)
+                if self.level[var] == self._decision_level():
+                    counter += 1
+                else:
+                    learnt.append(q)
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            lit = self.trail[index]
+            index -= 1
+            counter -= 1
+            if counter == 0:
+                break
+            clause = self.clauses[self.reason[abs(lit)]]
+        learnt[0] = -lit
+        back_level = 0
+        if len(learnt) > 1:
+            best = max(range(1, len(learnt)), key=lambda k: self.level[abs(learnt[k])])
+            learnt[1], learnt[best] = learnt[best], learnt[1]
+            back_level = self.level[abs(learnt[1])]
+        return learnt, back_level
+
+    def _bump(self, var: int) -> None:
+        """
+        Raises the activity of a variable seen in a conflict
+        """
+        self.activity[var] += self.bump
+        if self.activity[var] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.bump *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(1, self.num_vars + 1) \
+                         if self.assign[v] is None]
+            heapq.heapify(self.heap)
+        elif self.assign[var] is None:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+    def _backtrack(self, level: int) -> None:
+        """
+        Unassigns every literal above decision level `level`
+        """
+        if self._decision_level() <= level:
+            return
+        start = self.trail_lim[level]
+        for lit in self.trail[start:]:
+            var = abs(lit)
+            self.phase[var] = self.assign[var]
+            self.assign[var] = None
+            self.reason[var] = None
+            heapq.heappush(self.heap, (-self.activity[var], var))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def _pick_branch(self):
+        """
+        Gets the unassigned variable with the highest activity, None if all are assigned
+        """
+        while self.heap:
+            act, var = heapq.heappop(self.heap)
+            if self.assign[var] is None and -act == self.activity[var]:
+                return var
+        for var in range(1, self.num_vars + 1):
+            if self.assign[var] is None:
+                return var
+        return None
+
+    @staticmethod
+    def _luby(i: int) -> int:
+        """
+        The `i`th number (from 0) of the Luby sequence 1 1 2 1 1 2 4 ...
+        """
+        size, seq = 1, 0
+        while size < i + 1:
+            seq += 1
+            size = 2 * size + 1
+        while size - 1 != i:
+            size = (size - 1) >> 1
+            seq -= 1
+            i = i % size
+        return 2 ** seq
+
+    def solve(self) -> bool:
+        """
+        Looks for an assignment satisfying every clause
+        Returns True if one is found, readable with `value`
+        """
+        if self.unsat:
+            return False
+        self._backtrack(0)
+        restarts = 0
+        limit = self.RESTART_BASE * self._luby(restarts)
+        conflicts = 0
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts += 1
+                if self._decision_level() == 0:
+                    self.unsat = True
+                    return False
+                learnt, back_level = self._analyze(conflict)
+                self._backtrack(back_level)
+                if len(learnt) == 1:
+                    self._enqueue(learnt[0], None)
+                else:
+                    self._enqueue(learnt[0], self._attach(learnt))
+                self.bump /= self.ACTIVITY_DECAY
+                continue
+            if conflicts >= limit:
+                restarts += 1
+                limit = self.RESTART_BASE * self._luby(restarts)
+                conflicts = 0
+                self._backtrack(0)
+                continue
+            var = self._pick_branch()
+            if var is None:
+                self.model = self.assign[:]
+                self._backtrack(0)
+                return True
+            self.trail_lim.append(len(self.trail))
+            self._enqueue(var if self.phase[var] else -var, None)